@@ -27,13 +27,144 @@
 
 from lib.module import Modules
 from lib.model.smartplugin import *
-from lib.item import Items
 
-from pyfritzhome import Fritzhome, LoginError
+import itertools
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from operator import attrgetter, methodcaller
+
+from pyfritzhome import InvalidError, LoginError
+
+from .aha import STATS_SERIES, DeviceStats, FritzhomeConnection, hkr_target_temperature
+from .breaker import CircuitBreaker, CircuitOpenError
+from .commands import CommandQueue
+from .history import METRICS, STATISTICS, WINDOWS, History
+from .metrics import Metrics, summarize
 
 # If a needed package is imported, which might be not installed in the Python environment,
 # add it to a requirements.txt file within the plugin's directory
 
+# avm_smarthome_data values which are read from the device list: (attribute of the device, capability guard)
+READ_ATTRIBUTES = {
+    'name':                   ('name', None),
+    'ain':                    ('ain', None),
+    'identifier':             ('identifier', None),
+    'productname':            ('productname', None),
+    'manufacturer':           ('manufacturer', None),
+    'firmware_version':       ('fw_version', None),
+    'present':                ('present', None),
+    'lock':                   ('lock', None),
+    'device_lock':            ('device_lock', None),
+    'has_switch':             ('has_switch', None),
+    'has_temperature_sensor': ('has_temperature_sensor', None),
+    'has_thermostat':         ('has_thermostat', None),
+    'has_alarm':              ('has_alarm', None),
+    'switch_state':           ('switch_state', 'has_switch'),
+    'power':                  ('power', 'has_switch'),
+    'energy':                 ('energy', 'has_switch'),
+    'voltage':                ('voltage', 'has_switch'),
+    'temperature':            ('temperature', 'has_temperature_sensor'),
+    'offset':                 ('offset', 'has_temperature_sensor'),
+    'actual_temperature':     ('actual_temperature', 'has_thermostat'),
+    'target_temperature':     ('target_temperature', 'has_thermostat'),
+    'comfort_temperature':    ('comfort_temperature', 'has_thermostat'),
+    'eco_temperature':        ('eco_temperature', 'has_thermostat'),
+    'battery_low':            ('battery_low', 'has_thermostat'),
+    'battery_level':          ('battery_level', 'has_thermostat'),
+    'window_open':            ('window_open', 'has_thermostat'),
+    'summer_active':          ('summer_active', 'has_thermostat'),
+    'holiday_active':         ('holiday_active', 'has_thermostat'),
+    'alert_state':            ('alert_state', 'has_alarm'),
+}
+
+# avm_smarthome_data values with statistics of the history, e.g. power_avg_15m: (metric, statistic, window)
+HISTORY_ATTRIBUTES = {'{}_{}_{}'.format(metric, statistic, window): (metric, statistic, window)
+                      for metric in METRICS for statistic in STATISTICS for window in WINDOWS}
+
+# seconds after a command until the device is queried to confirm the new state
+REFRESH_DELAY = 2
+
+# threads besides the command workers which may use the connection to a Fritz!Box at the same time:
+# poll_device (scheduler or poll executor), poll_stats, refresh_device and the startup thread
+POLL_THREADS = 4
+
+# capabilities of a device, cached by discover()
+CAPABILITIES = ('has_switch', 'has_temperature_sensor', 'has_thermostat', 'has_alarm', 'has_powermeter')
+
+# avm_smarthome_data values of items sending commands to the Fritz!Box
+COMMAND_ATTRIBUTES = ('set_switch_state', 'set_switch_state_toggle', 'set_temperature', 'apply_template')
+
+# avm_smarthome_data values which (almost) never change and are polled with the parameter static_cycle
+STATIC_ATTRIBUTES = {'name', 'ain', 'identifier', 'productname', 'manufacturer', 'firmware_version',
+                     'has_switch', 'has_temperature_sensor', 'has_thermostat', 'has_alarm'}
+
+
+class _ItemBinding(object):
+    """
+    Binding of an item to a device attribute, resolved once in parse_item
+
+    The binding remembers the value last written to the item, so unchanged values do not need to be written again.
+    The poll interval is fixed (interval in seconds) or adapted to the activity of the device (interval None).
+    """
+
+    __slots__ = ('item', 'ain', 'box', 'attribute', 'getter', 'getter_is_attribute', 'guard', 'tolerance', 'interval', 'next_poll', 'last_value', 'last_write')
+
+    def __init__(self, item, ain, box, attribute, capability=None, tolerance=0, interval=None, getter=None):
+        self.item = item
+        self.ain = ain
+        self.box = box
+        self.attribute = attribute
+        self.getter = getter if getter is not None else attrgetter(attribute)
+        self.getter_is_attribute = getter is None         # the item shows the attribute itself (not e.g. a statistic of it)
+        self.guard = attrgetter(capability) if capability is not None else None
+        self.tolerance = tolerance
+        self.interval = interval
+        self.next_poll = 0
+        self.last_value = None
+        self.last_write = None
+
+    def needs_write(self, value, now, refresh_interval=0):
+        """
+        Checks if the value differs from the last written value (considering the tolerance)
+        or if the last write is older than the refresh interval
+
+        :param value: new value read from the device
+        :param now: current time (time.monotonic())
+        :param refresh_interval: seconds after which the item is written even if unchanged (0 = never)
+        :return: True, if the value should be written to the item
+        """
+        if self.last_write is None:
+            return True
+        if refresh_interval and now - self.last_write >= refresh_interval:
+            return True
+        if self.tolerance and isinstance(value, (int, float)) and not isinstance(value, bool) and self.last_value is not None:
+            return abs(value - self.last_value) > self.tolerance
+        return value != self.last_value
+
+
+class _Box(object):
+    """
+    A Fritz!Box managed by the plugin
+    """
+
+    __slots__ = ('name', 'host', 'user', 'password', 'ain_prefixes', 'fritzbox', 'breaker', 'lock')
+
+    def __init__(self, name, host, user, password, ain_prefixes=()):
+        self.name = name
+        self.host = host
+        self.user = user
+        self.password = password
+        self.ain_prefixes = tuple(ain_prefixes)
+        self.fritzbox = None
+        self.breaker = None
+        self.lock = threading.Lock()        # the startup, the poll jobs and the command workers may log in
+
 
 class AVM_smarthome(SmartPlugin):
     """
@@ -65,15 +196,66 @@ class AVM_smarthome(SmartPlugin):
 
         # get the parameters for the plugin (as defined in metadata plugin.yaml):
         self._cycle = self.get_parameter_value('cycle')                    # the frequency in seconds how often the query shoud be done
+        self._static_cycle = self.get_parameter_value('static_cycle')      # the frequency in seconds how often static values (name, firmware, ...) are queried
+        self._min_cycle = self.get_parameter_value('min_cycle')            # minimal time in seconds between two queries of the device list
+        self._stats_cycle = self.get_parameter_value('stats_cycle')        # the frequency in seconds how often the device statistics are queried
+        self._adaptive = self.get_parameter_value('adaptive')              # poll devices with changing values more often
         self.host = self.get_parameter_value('host')                       # IP Adress of the fritzbox
         self.user = self.get_parameter_value('username')                   # Username
         self.password = self.get_parameter_value('password')               # Password
+        self._refresh_interval = self.get_parameter_value('refresh_interval')   # seconds after which unchanged values are written again (0 = never)
+        self._command_workers = self.get_parameter_value('command_workers')     # number of threads sending commands to the fritzbox
+        self._sid_cache = self.get_parameter_value('sid_cache')                 # store the session id to reuse it after a restart
+        boxes = self.get_parameter_value('boxes')                               # further Fritz!Boxes managed by this instance
+        self._breaker_threshold = self.get_parameter_value('breaker_threshold') # consecutive failures after which a Fritz!Box is not queried anymore
+        self._breaker_backoff = self.get_parameter_value('breaker_backoff')     # initial and maximum time in seconds until an unreachable Fritz!Box is probed again
+        self._breaker_max_backoff = self.get_parameter_value('breaker_max_backoff')
+        self._confirm_window = self.get_parameter_value('confirm_window')       # seconds polled values conflicting with a command are not written
+        self._timeout = self.get_parameter_value('timeout')                     # timeout of the requests to the Fritz!Box
+        self._probe_timeout = self.get_parameter_value('probe_timeout')         # timeout of the requests to an unreachable Fritz!Box
+        self._history_snapshot = self.get_parameter_value('history_snapshot')   # keep the history of power, energy and voltage over a restart
         
         # Initialization code goes here
-        self.fritzbox = None
+        self.fritzbox = None                                               # connection to the Fritz!Box given by host
+        self._boxes = OrderedDict([('', _Box('', self.host, self.user, self.password))])
+        for name, box in (boxes or {}).items():
+            if not isinstance(box, dict) or not box.get('host'):
+                self.logger.error('Fritz!Box {} of parameter boxes has no host and is ignored.'.format(name))
+                continue
+            prefixes = box.get('ain_prefix', [])
+            if isinstance(prefixes, str):
+                prefixes = [prefixes]
+            self._boxes[str(name)] = _Box(str(name), box['host'], box.get('username', self.user), box.get('password', self.password), prefixes)
+        for box in self._boxes.values():
+            box.breaker = CircuitBreaker(box.host, self._breaker_threshold, self._breaker_backoff, self._breaker_max_backoff,
+                                         ignored=(InvalidError,), callback=self._breaker_changed)
+        self._executor = None                                              # polls several Fritz!Boxes in parallel, created in run()
+        self._ain_boxes = {}                                               # name of the Fritz!Box of each AIN
         self.alive = False
         self._items = []
         self._devices = []
+        self._device_ains = set()                                          # AINs of the device items
+        self._bindings = []                                                # _ItemBinding per read item, built in parse_item
+        self._stats_bindings = []                                          # _ItemBinding per statistics item (getbasicdevicestats)
+        self._stats_cache = {}                                             # DeviceStats per AIN, reused until older than the interval of the items
+        self._state_items = []                                             # (name of the Fritz!Box, item) of the items with avm_smarthome_data connection_state
+        self._item_view = None                                             # items grouped by AIN for the web interface, see get_item_view()
+        self._ain_cycles = {}                                              # current poll interval of each AIN in adaptive mode
+        self._tick = self._cycle                                           # interval of the poll_device scheduler job, set in run()
+        self._cycle_requests = 0                                           # number of HTTP requests of the last update cycle
+        self._cycle_writes = 0                                             # number of item writes of the last update cycle
+        self._cycle_writes_suppressed = 0                                  # number of unchanged values not written in the last update cycle
+        self._writes_suppressed = 0                                        # total number of unchanged values not written
+        self._metrics = Metrics()                                          # timings and counters shown in the web interface
+        self._history = History()                                          # min/max/avg of power, energy and voltage of the AINs with statistics items
+        self._commands = CommandQueue(self._command_workers, 'plugins.' + self.get_fullname() + '.commands', self.logger,
+                                      self._metrics.add_command)
+        self._command_ains = {}                                            # target AINs of each command item, resolved in parse_item
+        self._optimistic = {}                                              # (ain, attribute) -> (expected value, end of confirmation window)
+        self._write_lock = threading.RLock()                               # the poll jobs, refresh_device and the command workers write the read items
+        self._capabilities = {}                                            # capabilities of each AIN found by discover()
+        self._started = threading.Event()                                  # set after login and discovery, see startup()
+        self._toggle_count = itertools.count()                             # toggle commands are never coalesced
 
         # On initialization error use:
         #   self._init_complete = False
@@ -84,8 +266,8 @@ class AVM_smarthome(SmartPlugin):
         # if plugin should not start without web interface
         # if not self.init_webinterface():
         #     self._init_complete = False
-        
-        self.connect()
+
+        # the login is done in the background by run(), so a slow or unreachable Fritz!Box does not delay SmartHomeNG
         return
 
     def run(self):
@@ -93,35 +275,274 @@ class AVM_smarthome(SmartPlugin):
         Run method for the plugin
         """
         self.logger.debug("Run method called")
-        self.scheduler_add('poll_device', self.poll_device, cycle=self._cycle)
+        self._tick = self._get_tick()
+        if self._history_snapshot and self._history:
+            self._load_history()
+        for name, item in self._state_items:
+            item(self._boxes[name].breaker.state, self.get_shortname())
+        self.scheduler_add('poll_device', self.poll_device, cycle=self._tick)
+        if self._stats_bindings:
+            self.scheduler_add('poll_stats', self.poll_stats, cycle=self._get_stats_tick())
+        self._commands.start()
+        if len(self._boxes) > 1 and self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=len(self._boxes), thread_name_prefix='plugins.' + self.get_fullname() + '.poll')
         self.alive = True
+        threading.Thread(target=self._run_startup, name='plugins.' + self.get_fullname() + '.startup', daemon=True).start()
+
+    def _run_startup(self):
+        self.startup()
+        if self.alive:
+            # serve the items right away instead of waiting for the first scheduler call
+            self.poll_device(force=True)
+            if self._stats_bindings:
+                self.poll_stats()
+
+    def startup(self):
+        """
+        Logs in to the Fritz!Box(es) and discovers the configured devices, called in the background by run()
+
+        Until startup has finished, the poll jobs skip their cycles. With several Fritz!Boxes, login and
+        discovery of each Fritz!Box run as a task of the poll executor, so an unreachable Fritz!Box delays
+        the startup by one request timeout, but not the login of the other Fritz!Boxes.
+        """
+        start = time.perf_counter()
+        executor = self._executor
+        futures = []
+        unsupported = set()
+        for name, box in self._boxes.items():
+            if executor is not None:
+                try:
+                    futures.append(executor.submit(self._startup_box, name, box))
+                    continue
+                except RuntimeError:
+                    # executor was shut down by stop()
+                    pass
+            unsupported |= self._startup_box(name, box)
+        for future in futures:
+            unsupported |= future.result()
+        self._remove_bindings(unsupported)
+        self.fritzbox = self._boxes[''].fritzbox
+        self._started.set()
+        self.logger.debug('Startup finished in {:.0f} ms'.format((time.perf_counter() - start) * 1000))
 
     def stop(self):
         """
         Stop method for the plugin
         """
         self.logger.debug("Stop method called")
-        self.disconnect()
+        self._commands.stop()
+        if self._executor is not None:
+            # the plugin may be started again, run() creates a new executor then
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self.disconnect(logout=not self._sid_cache)
+        if self._history_snapshot and self._history:
+            self._save_history()
         self.alive = False
-        
+
+    def _get_history_file(self):
+        return os.path.join(self.get_sh().get_basedir(), 'var', 'avm_smarthome', 'history_{}.bin'.format(self.get_fullname()))
+
+    def _load_history(self):
+        filename = self._get_history_file()
+        if not os.path.exists(filename):
+            return
+        try:
+            count = self._history.load(filename)
+            self.logger.debug('History of {} device(s) read from {}'.format(count, filename))
+        except (OSError, ValueError, struct.error) as e:
+            self.logger.warning('History could not be read from {}: {}'.format(filename, e))
+
+    def _save_history(self):
+        filename = self._get_history_file()
+        try:
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            self._history.save(filename)
+        except OSError as e:
+            self.logger.warning('History could not be written to {}: {}'.format(filename, e))
+
     def connect(self):
         """
-        Connects to the AVM Fritzbox
+        Connects to the AVM Fritzbox(es)
+
+        A Fritz!Box which can not be reached is logged, the others are connected anyway. Logins are sent
+        through the circuit breaker of the Fritz!Box, so an unreachable Fritz!Box is not contacted again
+        before its backoff time has passed.
+        """
+        for box in self._boxes.values():
+            self._connect_box(box)
+        self.fritzbox = self._boxes[''].fritzbox
+
+    def _startup_box(self, name, box):
+        """
+        Connects to one Fritz!Box and discovers its devices, returns the bindings of unsupported attributes
         """
+        self._connect_box(box)
+        return self._discover_box(name, box)
+
+    def _connect_box(self, box):
         try:
-            self.fritzbox = Fritzhome(host=self.host, user=self.user, password=self.password)
-            self.fritzbox.login()
-            self.logger.debug('Login to Fritz!Box {} as {} successful.'.format(self.host, self.user))
+            box.breaker.call(self._login, box)
+        except CircuitOpenError as e:
+            self.logger.debug('Connection to Fritz!Box {} skipped: {}'.format(box.host, e))
         except LoginError:
-            self.logger.debug('Login to Fritz!Box {} as {} failed.'.format(self.host, self.user))
-            
-    def disconnect(self):
+            self.logger.debug('Login to Fritz!Box {} as {} failed.'.format(box.host, box.user))
+        except Exception as e:
+            self.logger.error('Connection to Fritz!Box {} failed: {}'.format(box.host, e))
+
+    def _login(self, box):
         """
-        Disconnects from the AVM Fritzbox
+        Creates the connection to a Fritz!Box and logs in (or reuses the stored SID)
+
+        The lock of the Fritz!Box serializes its logins, logins to different Fritz!Boxes do not wait for each other.
+        """
+        with box.lock:
+            if box.fritzbox is not None and box.fritzbox.logged_in:
+                # logged in by another thread meanwhile
+                return
+            self._create_session(box)
+
+    def _create_session(self, box):
+        if box.fritzbox is None:
+            sid_file = None
+            if self._sid_cache:
+                name = self.get_fullname() + ('_' + box.name if box.name else '')
+                sid_file = os.path.join(self.get_sh().get_basedir(), 'var', 'avm_smarthome', 'sid_{}.json'.format(name))
+            box.fritzbox = FritzhomeConnection(host=box.host, user=box.user, password=box.password,
+                                               sid_file=sid_file, pool_size=self._command_workers + POLL_THREADS)
+            box.fritzbox.timeout = self._timeout if box.breaker.state == CircuitBreaker.CLOSED else self._probe_timeout
+        if box.fritzbox.restore_sid():
+            self.logger.debug('Reusing stored session of Fritz!Box {} for {}.'.format(box.host, box.user))
+        else:
+            box.fritzbox.login()
+            self.logger.debug('Login to Fritz!Box {} as {} successful.'.format(box.host, box.user))
+
+    def discover(self):
+        """
+        Checks the configured AINs against the device lists of the Fritz!Box(es) once
+
+        Unknown AINs are logged. The capabilities (functionbitmask) of the devices are cached, so the poll
+        cycles do not need to check them anymore: the capability guard of items of a capable device is removed
+        and items of attributes a device does not have are not polled at all.
+        """
+        unsupported = set()
+        for name, box in self._boxes.items():
+            unsupported |= self._discover_box(name, box)
+        self._remove_bindings(unsupported)
+
+    def _discover_box(self, name, box):
+        """
+        Discovers the devices of one Fritz!Box, returns the bindings of attributes the devices do not have
+        """
+        unsupported = set()
+        ains = {ain for ain, box_name in self._ain_boxes.items() if box_name == name}
+        if not ains:
+            return unsupported
+        try:
+            devices = box.breaker.call(self._get_device_index, box, None, ())
+        except CircuitOpenError:
+            return unsupported
+        except Exception as e:
+            self.logger.warning('Discovery of the devices of Fritz!Box {} failed: {}'.format(box.host, e))
+            return unsupported
+        for avm_ain in sorted(ains):
+            device = devices.get(avm_ain)
+            if device is None:
+                self.logger.warning('Device with AIN {} is not known to Fritz!Box {}. Known AINs: {}'.format(avm_ain, box.host, ', '.join(sorted(devices))))
+            else:
+                self._capabilities[avm_ain] = {capability: getattr(device, capability) for capability in CAPABILITIES}
+        for binding in self._bindings:
+            device = devices.get(binding.ain)
+            if binding.box == name and binding.guard is not None and device is not None:
+                if binding.guard(device):
+                    binding.guard = None
+                else:
+                    self.logger.warning('Device with AIN {} does not support {}, item {} will not be updated.'.format(binding.ain, binding.attribute, binding.item))
+                    unsupported.add(binding)
+        return unsupported
+
+    def _remove_bindings(self, bindings):
+        if bindings:
+            self._bindings = [binding for binding in self._bindings if binding not in bindings]
+
+    def _supports(self, ain, capability):
+        """
+        Checks a capability (e.g. 'has_switch') of a device found by discover(), unknown AINs (e.g. templates) are supported
+        """
+        capabilities = self._capabilities.get(ain)
+        return capabilities is None or capabilities[capability]
+
+    def _breaker_changed(self, breaker, old, new):
+        """
+        Called by the circuit breaker of a Fritz!Box after a change of its state
+        """
+        if new == CircuitBreaker.OPEN:
+            self.logger.warning('Fritz!Box {} is not reachable ({}), next try in {:.0f} seconds.'.format(breaker.name, breaker.last_error, breaker.retry_in()))
+        elif new == CircuitBreaker.CLOSED:
+            self.logger.info('Fritz!Box {} is reachable again.'.format(breaker.name))
+        for box in self._boxes.values():
+            if box.breaker is breaker:
+                if box.fritzbox is not None:
+                    # probes of an unreachable Fritz!Box must not block the scheduler or the command workers for long
+                    box.fritzbox.timeout = self._timeout if new == CircuitBreaker.CLOSED else self._probe_timeout
+                for name, item in self._state_items:
+                    if name == box.name:
+                        item(new, self.get_shortname())
+
+    def disconnect(self, logout=True):
+        """
+        Disconnects from the AVM Fritzbox(es)
+
+        :param logout: if False, the session is kept valid at the Fritzbox to be reused after a restart; a Fritz!Box
+                       without session or with open circuit breaker is not contacted
+        """
+        for box in self._boxes.values():
+            if box.fritzbox is not None:
+                if logout and box.fritzbox.logged_in and not box.breaker.is_open():
+                    try:
+                        box.fritzbox.logout()
+                        self.logger.debug('Logout from Fritz!Box {} successful'.format(box.host))
+                    except Exception as e:
+                        self.logger.warning('Logout from Fritz!Box {} failed: {}'.format(box.host, e))
+                box.fritzbox.close()
+
+    def _get_box_name(self, device_item):
         """
-        if self.fritzbox is not None:
-            self.fritzbox.logout()
-            self.logger.debug('Logout successful')
+        Returns the name of the Fritz!Box of a device item
+
+        The Fritz!Box is given by the attribute avm_box of the device item or by the ain_prefix of a box in
+        parameter boxes. Otherwise it is the Fritz!Box given by host.
+        """
+        if device_item is None:
+            return ''
+        ain = self.get_iattr_value(device_item.conf, 'avm_ain')
+        if self.has_iattr(device_item.conf, 'avm_box'):
+            name = str(self.get_iattr_value(device_item.conf, 'avm_box'))
+            if name in self._boxes:
+                return name
+            self.logger.warning('Fritz!Box {} of item {} is not configured in parameter boxes, using {}.'.format(name, device_item, self.host))
+            return ''
+        return self._get_ain_box_name(ain)
+
+    def _get_ain_box_name(self, ain):
+        """
+        Returns the name of the Fritz!Box whose ain_prefix matches the AIN, otherwise '' (the Fritz!Box given by host)
+        """
+        if ain is None:
+            return ''
+        for box in self._boxes.values():
+            if box.ain_prefixes and str(ain).startswith(box.ain_prefixes):
+                return box.name
+        return ''
+
+    def _get_box(self, ain):
+        """
+        Returns the Fritz!Box of an AIN, also for AINs without device item (avm_smarthome_ains, plugin functions)
+        """
+        name = self._ain_boxes.get(ain)
+        if name is None:
+            name = self._get_ain_box_name(ain)
+        return self._boxes[name]
 
     def reconnect(self):
         """
@@ -151,18 +572,83 @@ class AVM_smarthome(SmartPlugin):
         # Process the device items
         if self.has_iattr(item.conf, 'avm_ain'):
             self.logger.debug('parse item: {}'.format(item))
+            self._item_view = None
             self._devices.append(item)
+            avm_ain = self.get_iattr_value(item.conf, 'avm_ain')
+            self._device_ains.add(avm_ain)
+            self._ain_boxes[avm_ain] = self._get_box_name(item)
             #self.logger.debug(self._devices)
             
         # Process the items read config
         if self.has_iattr(item.conf, 'avm_smarthome_data'):
             self.logger.debug('parse item: {}'.format(item))
             self._items.append(item)
+            self._item_view = None
             #self.logger.debug(self._items)
-        
+
+            avm_data = self.get_iattr_value(item.conf, 'avm_smarthome_data')
+            if avm_data == 'connection_state':
+                # state of the circuit breaker of the Fritz!Box of the parent device or given by avm_box
+                parent = item.return_parent()
+                if parent is not None and self.has_iattr(parent.conf, 'avm_ain'):
+                    name = self._get_box_name(parent)
+                else:
+                    name = self._get_box_name(item)
+                self._state_items.append((name, item))
+            elif avm_data in STATS_SERIES:
+                parent = item.return_parent()
+                if parent is not None and self.has_iattr(parent.conf, 'avm_ain'):
+                    interval = self._stats_cycle
+                    if self.has_iattr(item.conf, 'avm_smarthome_cycle'):
+                        interval = max(int(self.get_iattr_value(item.conf, 'avm_smarthome_cycle')), self._min_cycle)
+                    self._stats_bindings.append(_ItemBinding(item, self.get_iattr_value(parent.conf, 'avm_ain'), self._get_box_name(parent),
+                                                             avm_data, interval=interval, getter=methodcaller('get', avm_data)))
+                else:
+                    self.logger.warning('Item {} has no parent item with attribute avm_ain. Item will not be updated.'.format(item))
+            elif avm_data in READ_ATTRIBUTES or avm_data in HISTORY_ATTRIBUTES:
+                parent = item.return_parent()
+                if parent is not None and self.has_iattr(parent.conf, 'avm_ain'):
+                    avm_ain = self.get_iattr_value(parent.conf, 'avm_ain')
+                    getter = None
+                    if avm_data in HISTORY_ATTRIBUTES:
+                        metric, statistic, window = HISTORY_ATTRIBUTES[avm_data]
+                        self._history.add_ain(avm_ain)
+                        getter = partial(self._get_history_value, avm_ain, metric, window, statistic)
+                        attribute, capability = READ_ATTRIBUTES[metric]
+                    else:
+                        attribute, capability = READ_ATTRIBUTES[avm_data]
+                    tolerance = 0
+                    if self.has_iattr(item.conf, 'avm_smarthome_tolerance'):
+                        tolerance = float(self.get_iattr_value(item.conf, 'avm_smarthome_tolerance'))
+                    if self.has_iattr(item.conf, 'avm_smarthome_cycle'):
+                        interval = max(int(self.get_iattr_value(item.conf, 'avm_smarthome_cycle')), self._min_cycle)
+                    elif avm_data in STATIC_ATTRIBUTES:
+                        interval = self._static_cycle
+                    elif self._adaptive:
+                        interval = None
+                    else:
+                        interval = self._cycle
+                    self._bindings.append(_ItemBinding(item, avm_ain, self._get_box_name(parent),
+                                                       attribute, capability, tolerance, interval, getter))
+                else:
+                    self.logger.warning('Item {} has no parent item with attribute avm_ain. Item will not be updated.'.format(item))
+
         # Process the item write config
-        if self.get_iattr_value(item.conf, 'avm_smarthome_data') in ['set_switch_state', 'set_switch_state_toggle', 'set_temperature']:
+        if self.get_iattr_value(item.conf, 'avm_smarthome_data') in COMMAND_ATTRIBUTES:
             self.logger.debug('Update item: {}'.format(item))
+            # resolve the target AINs once: avm_smarthome_ains of the item or avm_ain of the parent item
+            if self.has_iattr(item.conf, 'avm_smarthome_ains'):
+                ains = self.get_iattr_value(item.conf, 'avm_smarthome_ains')
+                ains = [ains] if isinstance(ains, str) else list(ains)
+            else:
+                parent = item.return_parent()
+                ains = []
+                if parent is not None and self.has_iattr(parent.conf, 'avm_ain'):
+                    ains = [self.get_iattr_value(parent.conf, 'avm_ain')]
+            if ains and all(isinstance(ain, str) for ain in ains):
+                self._command_ains[item] = tuple(ains)
+            else:
+                self.logger.error('Item {} has no valid target: set avm_ain at the parent item or avm_smarthome_ains at the item.'.format(item))
             return self.update_item
 
     def parse_logic(self, logic):
@@ -191,134 +677,494 @@ class AVM_smarthome(SmartPlugin):
             # code to execute if the plugin is not stopped
             # and only, if the item has not been changed by this this plugin:
             self.logger.info("Update item: {}, item has been changed outside this plugin".format(item.id()))
-            
-            if self.get_iattr_value(item.conf, 'avm_smarthome_data') == 'set_temperature':
-                self.logger.debug("update_item was called with item '{}' from caller '{}', source '{}' and dest '{}'".format(item, caller, source, dest))
+            self.logger.debug("update_item was called with item '{}' from caller '{}', source '{}' and dest '{}'".format(item, caller, source, dest))
+
+            ains = self._command_ains.get(item)
+            if not ains:
+                return
+            self.logger.info("Target ain is {0}".format(', '.join(ains)))
+            avm_data = self.get_iattr_value(item.conf, 'avm_smarthome_data')
+            if avm_data == 'set_temperature':
                 cmd_temperature = float(item())
                 self.logger.debug("cmd_temp is: {0}".format(cmd_temperature))
-                parentItem = item.return_parent()
-                ainDevice = '0'
-                if isinstance(parentItem.conf['avm_ain'], str):
-                    ainDevice = parentItem.conf['avm_ain']
-                else:
-                    self.logger.error('device ain is not a string value')
-                self.logger.info("Target ain is {0}".format(ainDevice))
-                self.fritzbox.set_target_temperature(ainDevice, cmd_temperature)
-                
-            if self.get_iattr_value(item.conf, 'avm_smarthome_data') == 'set_switch_state':
-                self.logger.debug("update_item was called with item '{}' from caller '{}', source '{}' and dest '{}'".format(item, caller, source, dest))
-                state = bool(item())
-                parentItem = item.return_parent()
-                ainDevice = '0'
-                if isinstance(parentItem.conf['avm_ain'], str):
-                    ainDevice = parentItem.conf['avm_ain']
-                else:
-                    self.logger.error('device ain is not a string value')
-                self.logger.info("Target ain is {0}".format(ainDevice))
-                if state is True:
-                    self.fritzbox.set_switch_state_on(ainDevice)
+                self.set_temperature(ains, cmd_temperature)
+            elif avm_data == 'set_switch_state':
+                self.set_switch_state(ains, bool(item()))
+            elif avm_data == 'set_switch_state_toggle':
+                self.toggle_switch_state(ains)
+            elif avm_data == 'apply_template':
+                self.apply_template(ains)
+
+    def set_switch_state(self, ains, state):
+        """
+        Switches one or several devices or groups on or off
+
+        The commands are queued and sent concurrently by the command workers (parameter command_workers),
+        so switching many devices (e.g. an "all off" scene) does not block the caller.
+
+        :param ains: AIN or list of AINs of devices or groups
+        :param state: True to switch on, False to switch off
+        """
+        for ain in self._get_ain_list(ains, 'has_switch'):
+            if state:
+                self._put_command((ain, 'switch'), 'set_switch_state_on({})'.format(ain), 'set_switch_state_on', ain,
+                                  expect=('switch_state', bool))
+            else:
+                self._put_command((ain, 'switch'), 'set_switch_state_off({})'.format(ain), 'set_switch_state_off', ain,
+                                  expect=('switch_state', bool))
+
+    def toggle_switch_state(self, ains):
+        """
+        Toggles one or several devices or groups
+
+        :param ains: AIN or list of AINs of devices or groups
+        """
+        for ain in self._get_ain_list(ains, 'has_switch'):
+            self._put_command((ain, 'toggle', next(self._toggle_count)), 'set_switch_state_toggle({})'.format(ain),
+                              'set_switch_state_toggle', ain, expect=('switch_state', bool))
+
+    def set_temperature(self, ains, temperature):
+        """
+        Sets the target temperature of one or several thermostats or groups of thermostats
+
+        :param ains: AIN or list of AINs of thermostats or groups
+        :param temperature: target temperature in °C
+        """
+        for ain in self._get_ain_list(ains, 'has_thermostat'):
+            target = hkr_target_temperature(temperature)
+            self._put_command((ain, 'temperature'), 'set_target_temperature({}, {})'.format(ain, temperature),
+                              'set_target_temperature', ain, temperature, expect=('target_temperature', lambda result, target=target: target))
+
+    def apply_template(self, ains):
+        """
+        Applies one or several templates configured at the Fritz!Box
+
+        :param ains: identifier or list of identifiers of templates (e.g. 'tmp123456-1234567')
+        """
+        for ain in self._get_ain_list(ains):
+            self._put_command((ain, 'template'), 'apply_template({})'.format(ain), 'apply_template', ain)
+
+    def _get_ain_list(self, ains, capability=None):
+        """
+        Returns the AINs as list, AINs of devices without the capability are logged and skipped
+        """
+        ains = [ains] if isinstance(ains, str) else [str(ain) for ain in ains]
+        if capability is None:
+            return ains
+        supported = []
+        for ain in ains:
+            if self._supports(ain, capability):
+                supported.append(ain)
+            else:
+                self.logger.warning('Device with AIN {} does not support {}, command not sent.'.format(ain, capability))
+        return supported
+
+    def _put_command(self, key, description, method, *args, expect=None):
+        """
+        Queues a command for the Fritz!Box of the AIN key[0]
+
+        Commands for a Fritz!Box with open circuit breaker are dropped instead of waiting for a timeout.
+
+        :param method: name of the method of FritzhomeConnection sending the command
+        :param expect: (attribute, function returning the expected value of the attribute from the result of the
+                       command); if given, the read items of the attribute are updated after a successful command
+        """
+        box = self._get_box(key[0])
+        if box.breaker.is_open():
+            self.logger.warning('Command {} not sent, Fritz!Box {} is not reachable.'.format(description, box.host))
+            return
+
+        def send():
+            result = box.breaker.call(self._send_command, box, method, *args)
+            if expect is not None and self._confirm_window:
+                self._set_optimistic(key[0], expect[0], expect[1](result))
+
+        self._commands.put(key, description, send)
+
+    def _send_command(self, box, method, *args):
+        if box.fritzbox is None or not box.fritzbox.logged_in:
+            self._login(box)
+        try:
+            return getattr(box.fritzbox, method)(*args)
+        except InvalidError:
+            # pyfritzhome raises InvalidError without message
+            raise InvalidError('Fritz!Box {} rejected {}({}) as invalid'.format(box.host, method, ', '.join(map(str, args)))) from None
+
+    def _get_tick(self):
+        """
+        Returns the interval of the poll_device scheduler job
+
+        The interval is the shortest poll interval of all items, but not shorter than min_cycle. As
+        poll_device sends at most one request per call, this caps the request rate to the Fritz!Box.
+        """
+        intervals = {binding.interval for binding in self._bindings if binding.interval is not None}
+        if self._adaptive or not intervals:
+            intervals.add(self._min_cycle if self._adaptive else self._cycle)
+        return max(min(intervals), self._min_cycle)
+
+    def _fetch_devices(self, name, ains, fields):
+        """
+        Queries the devices with the given AINs from the Fritz!Box with the given name
+        """
+        box = self._boxes[name]
+        return box.breaker.call(self._get_device_index, box, ains, fields)
+
+    def _get_device_index(self, box, ains, fields):
+        if box.fritzbox is None or not box.fritzbox.logged_in:
+            self._login(box)
+        return box.fritzbox.get_device_index(ains, fields)
+
+    def _get_stats_tick(self):
+        """
+        Returns the interval of the poll_stats scheduler job
+        """
+        return max(min(binding.interval for binding in self._stats_bindings), self._min_cycle)
+
+    def poll_stats(self, force=False):
+        """
+        This method gets called by scheduler and updates the statistics items (getbasicdevicestats) which are due
+
+        The statistics of each AIN are fetched with one request and cached. They are fetched again when the cache
+        is older than the shortest interval of the due items of the AIN, so several items of a device share one request.
+
+        :param force: query all items and ignore the cache
+        """
+        if not self._started.is_set():
+            return
+        now = time.monotonic()
+        horizon = self._get_stats_tick() / 2       # tolerate scheduler jitter
+        due = [binding for binding in self._stats_bindings if force or binding.next_poll <= now + horizon]
+        if not due:
+            return
+
+        ttls = {}
+        for binding in due:
+            ttls[binding.ain] = min(ttls.get(binding.ain, binding.interval), binding.interval)
+        for avm_ain, ttl in ttls.items():
+            stats = self._stats_cache.get(avm_ain)
+            if stats is not None and not force and now - stats.fetched < ttl - horizon:
+                continue
+            box = self._get_box(avm_ain)
+            try:
+                text = box.breaker.call(self._send_command, box, 'get_basic_device_stats', avm_ain)
+            except CircuitOpenError:
+                continue
+            except Exception as e:
+                self.logger.warning('Query of the statistics of device {} failed: {}'.format(avm_ain, e))
+                continue
+            self._stats_cache[avm_ain] = DeviceStats(text, now)
+
+        shortname = self.get_shortname()
+        for binding in due:
+            binding.next_poll = now + binding.interval
+            stats = self._stats_cache.get(binding.ain)
+            if stats is None:
+                continue
+            try:
+                value = binding.getter(stats)
+            except Exception as e:
+                self.logger.warning('Statistics of device {} could not be parsed: {}'.format(binding.ain, e))
+                self._stats_cache.pop(binding.ain, None)
+                continue
+            if value is not None and binding.needs_write(value, now, self._refresh_interval):
+                binding.item(value, shortname)
+                binding.last_value = value
+                binding.last_write = now
+
+    def _write_values(self, bindings, devices, now):
+        """
+        Writes the values of the devices to the items of the bindings, unchanged values are not written
+
+        Values conflicting with the optimistic state of a recent command are not written until the Fritz!Box
+        confirms the state or the confirmation window has passed. The bindings and the optimistic state are
+        guarded by the write lock, as the command workers update them too.
+
+        :return: (number of writes, number of values not written, set of AINs with changed values)
+        """
+        shortname = self.get_shortname()
+        writes = 0
+        suppressed = 0
+        changed_ains = set()
+        with self._write_lock:
+            for binding in bindings:
+                device = devices.get(binding.ain)
+                if device is None or not device.present:
+                    continue
+                if binding.guard is None or binding.guard(device):
+                    value = binding.getter(device)
+                    if value is None:
+                        # attribute not available or no samples in the window of a statistic
+                        continue
+                    if self._optimistic:
+                        optimistic = self._optimistic.get((binding.ain, binding.attribute))
+                        if optimistic is not None:
+                            if value == optimistic[0] or now >= optimistic[1]:
+                                # confirmed by the Fritz!Box, or not applied within the confirmation window
+                                self._optimistic.pop((binding.ain, binding.attribute), None)
+                            else:
+                                # the Fritz!Box may still be applying the command
+                                suppressed += 1
+                                continue
+                    if binding.needs_write(value, now, self._refresh_interval):
+                        if value != binding.last_value:
+                            changed_ains.add(binding.ain)
+                        binding.item(value, shortname)
+                        binding.last_value = value
+                        binding.last_write = now
+                        writes += 1
+                    else:
+                        suppressed += 1
+        return writes, suppressed, changed_ains
+
+    def _set_optimistic(self, ain, attribute, value):
+        """
+        Writes the state expected after a successful command to the read items of the AIN right away
+
+        The state is kept for confirm_window seconds, polled values conflicting with it are not written meanwhile.
+        One refresh of only this AIN is scheduled to confirm the state.
+        """
+        now = time.monotonic()
+        shortname = self.get_shortname()
+        with self._write_lock:
+            self._optimistic[(ain, attribute)] = (value, now + self._confirm_window)
+            for binding in self._bindings:
+                if binding.ain == ain and binding.attribute == attribute and binding.getter_is_attribute:
+                    if binding.last_value != value:
+                        binding.item(value, shortname)
+                        binding.last_value = value
+                        binding.last_write = now
+        if self.alive:
+            self.scheduler_add('refresh_' + ain, partial(self.refresh_device, ain),
+                               next=self.get_sh().shtime.now() + timedelta(seconds=REFRESH_DELAY))
+
+    def refresh_device(self, ain):
+        """
+        Queries only the given AIN (getdeviceinfos) and updates its read items, e.g. to confirm a command
+        """
+        bindings = [binding for binding in self._bindings if binding.ain == ain]
+        if not bindings:
+            return
+        box = self._get_box(ain)
+        fields = {binding.attribute for binding in bindings}
+        try:
+            devices = box.breaker.call(self._send_command, box, 'get_device_info', ain, fields)
+        except CircuitOpenError:
+            return
+        except Exception as e:
+            self.logger.warning('Refresh of device {} failed: {}'.format(ain, e))
+            return
+        writes, suppressed, changed_ains = self._write_values(bindings, devices, time.monotonic())
+        self.logger.debug('Refresh of device {} finished with {} item write(s)'.format(ain, writes))
+
+    def _set_not_present(self, box_names, now):
+        """
+        Writes False once to the present items of the devices of Fritz!Boxes with open circuit breaker
+        """
+        box_names = {name for name in box_names if self._boxes[name].breaker.state != CircuitBreaker.CLOSED}
+        shortname = self.get_shortname()
+        with self._write_lock:
+            for binding in self._bindings:
+                if binding.attribute == 'present' and binding.box in box_names:
+                    if binding.last_value is not False:
+                        binding.item(False, shortname)
+                        binding.last_value = False
+                        binding.last_write = now
+
+    def poll_device(self, force=False):
+        """
+        This method gets called by scheduler and queries the data of all items which are due
+
+        All due items are served from one query of the device list.
+
+        :param force: query all items, even if they are not due
+        """
+        if not self._started.is_set():
+            return
+        now = time.monotonic()
+        horizon = now + self._tick / 2              # tolerate scheduler jitter
+        due = [binding for binding in self._bindings if force or binding.next_poll <= horizon]
+        if not due:
+            return
+
+        self.logger.debug('Starting update loop for instance {} with {} item(s).'.format(self.get_instance_name(), len(due)))
+        request_count = self._get_request_count()
+        start = time.perf_counter()
+
+        # fetch the device list of each Fritz!Box only once per cycle and serve all items from this snapshot,
+        # several Fritz!Boxes are queried in parallel
+        box_ains = {}
+        for binding in due:
+            box_ains.setdefault(binding.box, set()).add(binding.ain)
+        fields = {binding.attribute for binding in due}
+        executor = self._executor
+        futures = {name: None for name in box_ains}
+        if executor is not None and len(box_ains) > 1:
+            try:
+                for name, ains in box_ains.items():
+                    futures[name] = executor.submit(self._fetch_devices, name, ains, fields)
+            except RuntimeError:
+                # executor shut down by stop() meanwhile, the remaining Fritz!Boxes are queried one after another
+                pass
+
+        devices = {}
+        fetch_time = 0.0
+        parse_time = 0.0
+        box_times = {}                              # name of the Fritz!Box -> fetch + parse time of its device list
+        failed_boxes = set()
+        skipped_boxes = set()
+        for name, future in futures.items():
+            box = self._boxes[name]
+            try:
+                if future is None:
+                    devices.update(self._fetch_devices(name, box_ains[name], fields))
                 else:
-                    self.fritzbox.set_switch_state_off(ainDevice)
-                    
-            if self.get_iattr_value(item.conf, 'avm_smarthome_data') == 'set_switch_state_toggle':
-                self.logger.debug("update_item was called with item '{}' from caller '{}', source '{}' and dest '{}'".format(item, caller, source, dest))
-                state = bool(item())
-                parentItem = item.return_parent()
-                ainDevice = '0'
-                if isinstance(parentItem.conf['avm_ain'], str):
-                    ainDevice = parentItem.conf['avm_ain']
+                    devices.update(future.result())
+            except CircuitOpenError:
+                # the Fritz!Box is known to be unreachable, it is probed again after the backoff time
+                skipped_boxes.add(name)
+                continue
+            except Exception as e:
+                failed_boxes.add(name)
+                self.logger.error('Query of the device list of Fritz!Box {} failed: {}'.format(box.host, e))
+                continue
+            # the Fritz!Boxes are queried in parallel, so the cycle takes as long as the slowest one
+            fetch_time = max(fetch_time, box.fritzbox.fetch_time)
+            parse_time = max(parse_time, box.fritzbox.parse_time)
+            box_times[name] = box.fritzbox.fetch_time + box.fritzbox.parse_time
+            for avm_ain in box_ains[name]:
+                device = devices.get(avm_ain)
+                if device is None:
+                    self.logger.warning('Device with AIN {} not found at Fritz!Box {}.'.format(avm_ain, box.host))
+                elif not device.present:
+                    self.logger.debug('Requested device with AIN {} is not present.'.format(avm_ain))
+
+        if failed_boxes:
+            self._metrics.add_cycle_error()
+        if failed_boxes or skipped_boxes:
+            self._set_not_present(failed_boxes | skipped_boxes, now)
+            if len(failed_boxes) + len(skipped_boxes) == len(box_ains):
+                return
+            # items of unreachable Fritz!Boxes stay due and are queried again with the next cycle
+            due = [binding for binding in due if binding.box not in failed_boxes and binding.box not in skipped_boxes]
+        due_ains = {binding.ain for binding in due}
+        write_start = time.perf_counter()
+
+        if self._history:
+            timestamp = time.time()
+            for avm_ain in due_ains:
+                device = devices.get(avm_ain)
+                if device is not None and device.present and avm_ain in self._history:
+                    self._history.add(avm_ain, device, timestamp)
+
+        adaptive = []
+        for binding in due:
+            if binding.interval is None:
+                adaptive.append(binding)
+            else:
+                binding.next_poll = now + binding.interval
+        writes, suppressed, changed_ains = self._write_values(due, devices, now)
+
+        if adaptive:
+            # poll devices with changing values faster, back off for idle devices
+            for avm_ain in {binding.ain for binding in adaptive}:
+                ain_cycle = self._ain_cycles.get(avm_ain, self._cycle)
+                if avm_ain in changed_ains:
+                    self._ain_cycles[avm_ain] = max(ain_cycle / 2, self._min_cycle)
                 else:
-                    self.logger.error('device ain is not a string value')
-                self.logger.info("Target ain is {0}".format(ainDevice))
-                self.fritzbox.set_switch_state_toggle(ainDevice)
+                    self._ain_cycles[avm_ain] = min(ain_cycle * 2, self._cycle)
+            for binding in adaptive:
+                binding.next_poll = now + self._ain_cycles[binding.ain]
 
-            pass
+        self._cycle_writes = writes
+        self._cycle_writes_suppressed = suppressed
+        self._writes_suppressed += suppressed
+
+        end = time.perf_counter()
+        if not failed_boxes and not skipped_boxes:
+            # each AIN is attributed the time of the device list of its own Fritz!Box
+            ain_times = {binding.ain: box_times[binding.box] for binding in due}
+            self._metrics.add_cycle(end - start, fetch_time, parse_time, end - write_start, ain_times)
+
+        self._cycle_requests = self._get_request_count() - request_count
+        self.logger.debug('Update loop for instance {} finished with {} HTTP request(s), {} item write(s) and {} unchanged value(s) not written.'.format(self.get_instance_name(), self._cycle_requests, writes, suppressed))
 
-    def poll_device(self):
+    def _get_request_count(self):
         """
-        This method gets called by scheduler and queries all data
+        Returns the number of HTTP requests sent to all Fritz!Boxes
         """
-        self.logger.debug('Starting update loop for instance {}.'.format(self.get_instance_name()))
-        
-        for item in self._devices:
-            if self.has_iattr(item.conf, 'avm_ain'):
-                avm_ain = self.get_iattr_value(item.conf, 'avm_ain')
-                
-            device = self.fritzbox.get_device_by_ain(avm_ain)
-            
-            if device.present == True:
-                for child in item.return_children():
-                    if self.has_iattr(child.conf, 'avm_smarthome_data'):
-                        if self.get_iattr_value(child.conf, 'avm_smarthome_data') == 'name':
-                            child(device.name, self.get_shortname())
-                        elif self.get_iattr_value(child.conf, 'avm_smarthome_data') == 'ain':
-                            child(device.ain, self.get_shortname())
-                        elif self.get_iattr_value(child.conf, 'avm_smarthome_data') == 'identifier':
-                            child(device.identifier, self.get_shortname())
-                        elif self.get_iattr_value(child.conf, 'avm_smarthome_data') == 'productname':
-                            child(device.productname, self.get_shortname())
-                        elif self.get_iattr_value(child.conf, 'avm_smarthome_data') == 'manufacturer':
-                            child(device.manufacturer, self.get_shortname())
-                        elif self.get_iattr_value(child.conf, 'avm_smarthome_data') == 'firmware_version':
-                            child(device.fw_version, self.get_shortname())   
-                        elif self.get_iattr_value(child.conf, 'avm_smarthome_data') == 'present':
-                            child(device.present, self.get_shortname())
-                        elif self.get_iattr_value(child.conf, 'avm_smarthome_data') == 'lock':
-                            child(device.lock, self.get_shortname())
-                        elif self.get_iattr_value(child.conf, 'avm_smarthome_data') == 'device_lock':
-                            child(device.device_lock, self.get_shortname())
-                        elif self.get_iattr_value(child.conf, 'avm_smarthome_data') == 'has_switch':
-                            child(device.has_switch, self.get_shortname())
-                        elif self.get_iattr_value(child.conf, 'avm_smarthome_data') == 'has_temperature_sensor':
-                            child(device.has_temperature_sensor, self.get_shortname())
-                        elif self.get_iattr_value(child.conf, 'avm_smarthome_data') == 'has_thermostat':
-                            child(device.has_thermostat, self.get_shortname())
-                        elif self.get_iattr_value(child.conf, 'avm_smarthome_data') == 'has_alarm':
-                            child(device.has_alarm, self.get_shortname())
-                            
-                        if device.has_switch:
-                            if self.get_iattr_value(child.conf, 'avm_smarthome_data') == 'switch_state':
-                                child(device.switch_state, self.get_shortname())
-                            elif self.get_iattr_value(child.conf, 'avm_smarthome_data') == 'power':
-                                child(device.power, self.get_shortname())
-                            elif self.get_iattr_value(child.conf, 'avm_smarthome_data') == 'energy':
-                                child(device.energy, self.get_shortname())
-                            elif self.get_iattr_value(child.conf, 'avm_smarthome_data') == 'voltage':
-                                child(device.voltage, self.get_shortname())
-                                
-                        if device.has_temperature_sensor:
-                            if self.get_iattr_value(child.conf, 'avm_smarthome_data') == 'temperature':
-                                child(device.temperature, self.get_shortname())
-                            elif self.get_iattr_value(child.conf, 'avm_smarthome_data') == 'offset':
-                                child(device.offset, self.get_shortname())
-                                
-                        if device.has_thermostat:
-                            if self.get_iattr_value(child.conf, 'avm_smarthome_data') == 'actual_temperature':
-                                child(device.actual_temperature, self.get_shortname())
-                            elif self.get_iattr_value(child.conf, 'avm_smarthome_data') == 'target_temperature':
-                                child(device.target_temperature, self.get_shortname())
-                            elif self.get_iattr_value(child.conf, 'avm_smarthome_data') == 'comfort_temperature':
-                                child(device.comfort_temperature, self.get_shortname())
-                            elif self.get_iattr_value(child.conf, 'avm_smarthome_data') == 'eco_temperature':
-                                child(device.eco_temperature, self.get_shortname())
-                            elif self.get_iattr_value(child.conf, 'avm_smarthome_data') == 'battery_low':
-                                child(device.battery_low, self.get_shortname())
-                            elif self.get_iattr_value(child.conf, 'avm_smarthome_data') == 'battery_level':
-                                child(device.battery_level, self.get_shortname())
-                            elif self.get_iattr_value(child.conf, 'avm_smarthome_data') == 'window_open':
-                                child(device.window_open, self.get_shortname())
-                            elif self.get_iattr_value(child.conf, 'avm_smarthome_data') == 'summer_active':
-                                child(device.summer_active, self.get_shortname())
-                            elif self.get_iattr_value(child.conf, 'avm_smarthome_data') == 'holiday_active':
-                                child(device.holiday_active, self.get_shortname())
-                                
-                        if device.has_alarm:
-                            if self.get_iattr_value(child.conf, 'avm_smarthome_data') == 'alert_state':
-                                child(device.alert_state, self.get_shortname())
-            else:
-                self.logger.debug('Requested device with AIN {} is not present.'.format(avm_ain))
+        return sum(box.fritzbox.request_count for box in self._boxes.values() if box.fritzbox is not None)
 
-        pass
+    def get_metrics(self):
+        """
+        Returns the timings and counters of the plugin
+
+        reconnects counts the logins after a Fritz!Box rejected an expired SID, command_latency the time from
+        queueing a command to its completion.
+
+        :return: dict, durations in milliseconds
+        """
+        metrics = self._metrics.as_dict()
+        connections = [box.fritzbox for box in self._boxes.values() if box.fritzbox is not None]
+        metrics['logins'] = sum(fritzbox.login_count for fritzbox in connections)
+        metrics['reconnects'] = sum(fritzbox.relogin_count for fritzbox in connections)
+        metrics['command_latency'] = summarize(self._commands.latency)
+        metrics['requests'] = self._get_request_count()
+        metrics['cycle_requests'] = self._cycle_requests
+        metrics['queue_depth'] = self._commands.depth
+        metrics['breakers'] = {name: dict(box.breaker.as_dict(), host=box.host) for name, box in self._boxes.items()}
+        return metrics
+
+    def _get_history_value(self, ain, metric, window, statistic, device):
+        """
+        Getter of the items with a statistic of the history (the device has been added to the history before)
+        """
+        return self._history.get(ain, metric, window, statistic)
+
+    def get_history(self):
+        """
+        Returns min/max/avg of power, energy and voltage of all windows for the web interface
+
+        :return: dict {ain: {metric: {window: {'min', 'max', 'avg'} or None}}}
+        """
+        return self._history.as_dict()
+
+    def get_item_view(self):
+        """
+        Returns the items of the plugin grouped by AIN for the web interface
+
+        The view is built on first use and rebuilt only after parse_item has been called again.
+
+        :return: list of (ain, device item, list of items sorted by path), sorted by AIN
+        """
+        if self._item_view is None:
+            devices = {self.get_iattr_value(device.conf, 'avm_ain'): device for device in self._devices}
+            groups = {}
+            for item in self._items:
+                parent = item.return_parent()
+                ain = ''
+                if parent is not None and self.has_iattr(parent.conf, 'avm_ain'):
+                    ain = self.get_iattr_value(parent.conf, 'avm_ain')
+                groups.setdefault(ain, []).append(item)
+            self._item_view = [(ain, devices.get(ain), sorted(items, key=lambda item: item.property.path.lower()))
+                               for ain, items in sorted(groups.items())]
+        return self._item_view
+
+    def get_item_values(self, since=None):
+        """
+        Returns the values of the items of the plugin
+
+        :param since: timestamp (seconds since epoch); if given, only items updated after it are returned
+        :return: dict {item path: {'value', 'last_update', 'last_change'}}
+        """
+        values = {}
+        for item in self._items:
+            last_update = item.property.last_update
+            if since is not None and last_update.timestamp() <= since:
+                continue
+            values[item.property.path] = {'value': item(),
+                                          'last_update': last_update.strftime('%d.%m.%Y %H:%M:%S'),
+                                          'last_change': item.property.last_change.strftime('%d.%m.%Y %H:%M:%S')}
+        return values
 
     def init_webinterface(self):
         """"
@@ -366,6 +1212,8 @@ class AVM_smarthome(SmartPlugin):
 #    Webinterface of the plugin
 # ------------------------------------------
 
+import json
+
 import cherrypy
 from jinja2 import Environment, FileSystemLoader
 
@@ -386,7 +1234,6 @@ class WebInterface(SmartPluginWebIf):
         self.plugin = plugin
         self.tplenv = self.init_template_environment()
 
-        self.items = Items.get_instance()
 
     @cherrypy.expose
     def index(self, reload=None):
@@ -399,31 +1246,33 @@ class WebInterface(SmartPluginWebIf):
         """
         tmpl = self.tplenv.get_template('index.html')
         # add values to be passed to the Jinja2 template eg: tmpl.render(p=self.plugin, interface=interface, ...)
-        return tmpl.render(p=self.plugin, items=sorted(self.items.return_items(), key=lambda k: str.lower(k['_path'])))
+        # the page requests only the items updated after it has been rendered
+        render_timestamp = time.time()
+        return tmpl.render(p=self.plugin, item_view=self.plugin.get_item_view(), render_timestamp=render_timestamp)
 
 
     @cherrypy.expose
-    def get_data_html(self, dataSet=None):
+    def get_data_html(self, dataSet=None, since=None):
         """
         Return data to update the webpage
 
-        For the standard update mechanism of the web interface, the dataSet to return the data for is None
+        The page calls it periodically with the timestamp of the previous response as since, so only the
+        items updated meanwhile are serialized.
 
         :param dataSet: Dataset for which the data should be returned (standard: None)
+        :param since: timestamp (seconds since epoch); if given, only items updated after it are returned
         :return: dict with the data needed to update the web page.
         """
         if dataSet is None:
-            # get the new data
-            data = {}
-
-            # data['item'] = {}
-            # for i in self.plugin.items:
-            #     data['item'][i]['value'] = self.plugin.getitemvalue(i)
-            #
-            # return it as json the the web page
-            # try:
-            #     return json.dumps(data)
-            # except Exception as e:
-            #     self.logger.error("get_data_html exception: {}".format(e))
+            # return the timings and counters of the plugin and the values of its items as json to the web page
+            try:
+                # taken before the items are read, so no update is missed by the next request with since=timestamp
+                timestamp = time.time()
+                data = {'timestamp': timestamp,
+                        'metrics': self.plugin.get_metrics(),
+                        'history': self.plugin.get_history(),
+                        'items': self.plugin.get_item_values(float(since) if since else None)}
+                return json.dumps(data)
+            except Exception as e:
+                self.logger.error("get_data_html exception: {}".format(e))
         return {}
-
@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  Copyright 2019-      <AUTHOR>                                  <EMAIL>
+#########################################################################
+#  This file is part of SmartHomeNG.
+#  https://www.smarthomeNG.de
+#  https://knx-user-forum.de/forum/supportforen/smarthome-py
+#
+#  SmartHomeNG is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SmartHomeNG is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SmartHomeNG. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+"""
+Connection to the AVM home automation HTTP interface (AHA) of a Fritz!Box
+
+This module only depends on pyfritzhome, so it can be used without SmartHomeNG (e.g. by the tools in ./tools).
+"""
+
+import json
+import os
+import threading
+import time
+import xml.parsers.expat      # Fritzhome.login() catches xml.parsers.expat.ExpatError without importing it
+from xml.etree.ElementTree import XMLPullParser, fromstring
+
+from pyfritzhome import Fritzhome
+from requests.adapters import HTTPAdapter
+from requests.exceptions import HTTPError
+
+# function bits of the functionbitmask attribute of a device
+ALARM_MASK = 0x010
+THERMOSTAT_MASK = 0x040
+POWER_METER_MASK = 0x080
+TEMPERATURE_MASK = 0x100
+SWITCH_MASK = 0x200
+
+
+def _int_bool(text):
+    return bool(int(text))
+
+
+def _half(text):
+    return float(text) / 2
+
+
+def _tenth(text):
+    return int(text) / 10
+
+
+def _milli(text):
+    return int(text) / 1000
+
+
+def _centi_to_milli(text):
+    return int(text) * 10
+
+
+# attributes of FritzhomeDevice, which are read from xml attributes of the <device> element
+DEVICE_XML_ATTRIBUTES = {
+    'ain':          'identifier',
+    'identifier':   'id',
+    'fw_version':   'fwversion',
+    'manufacturer': 'manufacturer',
+    'productname':  'productname',
+}
+
+# attributes of FritzhomeDevice, which are read from sub elements of the <device> element: (paths, converter)
+DEVICE_FIELDS = {
+    'name':                (('name',), str),
+    'present':             (('present',), _int_bool),
+    'lock':                (('switch/lock', 'hkr/lock'), _int_bool),
+    'device_lock':         (('switch/devicelock', 'hkr/devicelock'), _int_bool),
+    'switch_state':        (('switch/state',), _int_bool),
+    'power':               (('powermeter/power',), int),
+    'energy':              (('powermeter/energy',), int),
+    'voltage':             (('powermeter/voltage',), _milli),
+    'temperature':         (('temperature/celsius',), _tenth),
+    'offset':              (('temperature/offset',), _tenth),
+    'actual_temperature':  (('hkr/tist',), _half),
+    'target_temperature':  (('hkr/tsoll',), _half),
+    'comfort_temperature': (('hkr/komfort',), _half),
+    'eco_temperature':     (('hkr/absenk',), _half),
+    'battery_low':         (('hkr/batterylow',), _int_bool),
+    'battery_level':       (('hkr/battery',), int),
+    'window_open':         (('hkr/windowopenactiv',), _int_bool),
+    'summer_active':       (('hkr/summeractive',), _int_bool),
+    'holiday_active':      (('hkr/holidayactive',), _int_bool),
+    'alert_state':         (('alert/state',), _int_bool),
+}
+
+
+# series of getbasicdevicestats: (element, grid in seconds or None for the first series of the element, converter)
+# the values are converted to the units of the device list values (power in mW, voltage in V, temperature in °C)
+STATS_SERIES = {
+    'stats_temperature':    ('temperature', None, _tenth),
+    'stats_voltage':        ('voltage', None, _milli),
+    'stats_power':          ('power', None, _centi_to_milli),
+    'stats_energy_daily':   ('energy', 86400, int),
+    'stats_energy_monthly': ('energy', 2678400, int),
+}
+
+
+class DeviceStats(object):
+    """
+    Series of getbasicdevicestats of one device (newest value first)
+
+    The xml is only parsed when the first series is requested and each series is converted on first access,
+    so series which are not used by any item are never converted.
+    """
+
+    __slots__ = ('fetched', '_text', '_root', '_series')
+
+    def __init__(self, text, fetched):
+        """
+        :param text: xml returned by getbasicdevicestats
+        :param fetched: time the xml has been fetched (time.monotonic())
+        """
+        self.fetched = fetched
+        self._text = text
+        self._root = None
+        self._series = {}
+
+    def get(self, series):
+        """
+        :param series: name of the series (key of STATS_SERIES)
+        :return: list of values (None for gaps), None if the device does not offer the series
+        """
+        if series not in self._series:
+            self._series[series] = self._parse(series)
+        return self._series[series]
+
+    def _parse(self, series):
+        if self._root is None:
+            self._root = fromstring(self._text)
+        tag, grid, converter = STATS_SERIES[series]
+        for stats in self._root.iterfind(tag + '/stats'):
+            if grid is None or stats.get('grid') == str(grid):
+                return [converter(value) if value not in ('', '-') else None for value in (stats.text or '').split(',')]
+        return None
+
+
+def hkr_target_temperature(temperature):
+    """
+    Returns the target temperature a thermostat reports after set_target_temperature(temperature)
+
+    The temperature is sent in steps of 0.5 °C, values below 8 °C switch the thermostat off (126.5),
+    values above 28 °C switch it on (127.0).
+    """
+    param = 16 + ((float(temperature) - 8) * 2)
+    if param < 16:
+        param = 253
+    elif param > 55:
+        param = 254
+    return _half(int(param))
+
+
+class DeviceSnapshot(object):
+    """
+    Values of one device as read from a device list, offering the attributes of FritzhomeDevice
+
+    Only the requested fields are filled, all other attributes return None.
+    """
+
+    __slots__ = ('functionbitmask',) + tuple(DEVICE_XML_ATTRIBUTES) + tuple(DEVICE_FIELDS)
+
+    def __init__(self, element, fields):
+        self.functionbitmask = int(element.get('functionbitmask', 0))
+        for attribute, xml_attribute in DEVICE_XML_ATTRIBUTES.items():
+            setattr(self, attribute, element.get(xml_attribute))
+        for field in fields:
+            paths, converter = DEVICE_FIELDS[field]
+            for path in paths:
+                text = element.findtext(path)
+                if text is not None:
+                    try:
+                        setattr(self, field, converter(text))
+                    except ValueError:
+                        pass
+                    break
+
+    def __getattr__(self, name):
+        # only called for attributes (slots) which have not been set
+        if name in DEVICE_FIELDS:
+            return None
+        raise AttributeError(name)
+
+    def __repr__(self):
+        return '{} {} {} {} {}'.format(self.ain, self.identifier, self.manufacturer, self.productname, self.name)
+
+    @property
+    def has_alarm(self):
+        return bool(self.functionbitmask & ALARM_MASK)
+
+    @property
+    def has_thermostat(self):
+        return bool(self.functionbitmask & THERMOSTAT_MASK)
+
+    @property
+    def has_powermeter(self):
+        return bool(self.functionbitmask & POWER_METER_MASK)
+
+    @property
+    def has_temperature_sensor(self):
+        return bool(self.functionbitmask & TEMPERATURE_MASK)
+
+    @property
+    def has_switch(self):
+        return bool(self.functionbitmask & SWITCH_MASK)
+
+
+def parse_device_list(chunks, ains=None, fields=None):
+    """
+    Parses the xml of getdevicelistinfos incrementally
+
+    Groups are returned like devices. Only devices and groups with one of the given AINs are materialized,
+    all other <device> and <group> elements are discarded as soon as they are parsed.
+
+    :param chunks: iterable of bytes, containing the xml of the device list
+    :param ains: collection of AINs to be returned (None = all devices)
+    :param fields: collection of device attributes to be read, names without an entry in DEVICE_FIELDS are ignored (None = all fields)
+    :return: dict {ain: DeviceSnapshot}
+    """
+    if fields is None:
+        fields = DEVICE_FIELDS
+    else:
+        fields = (DEVICE_FIELDS.keys() & set(fields)) | {'name', 'present'}
+
+    devices = {}
+    parser = XMLPullParser(events=('end',))
+    for chunk in chunks:
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            if element.tag == 'device' or element.tag == 'group':
+                ain = element.get('identifier')
+                if ains is None or ain in ains:
+                    devices[ain] = DeviceSnapshot(element, fields)
+                element.clear()
+    parser.close()
+    return devices
+
+
+class FritzhomeConnection(Fritzhome):
+    """
+    Connection to a Fritz!Box, which keeps track of the number of HTTP requests sent to the Fritz!Box
+
+    All requests use one keep-alive HTTP session with a connection pool. If the Fritz!Box rejects a request
+    because the session ID (SID) is invalid or expired, the connection logs in again and repeats the request once.
+    Optionally the SID is stored in a file, so a restart can reuse it without a new login.
+    """
+
+    def __init__(self, host, user, password, sid_file=None, pool_size=4):
+        """
+        :param sid_file: file to store the SID in (None = SID is not stored)
+        :param pool_size: maximum number of pooled HTTP connections (should match the number of threads using the connection)
+        """
+        super().__init__(host=host, user=user, password=password)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._sid_file = sid_file
+        self._login_lock = threading.Lock()
+        self.timeout = 10               # timeout of the HTTP requests in seconds
+        self.request_count = 0
+        self.login_count = 0
+        self.relogin_count = 0          # logins after the Fritz!Box rejected an expired SID
+        self.fetch_time = 0.0           # seconds spent receiving the last device list
+        self.parse_time = 0.0           # seconds spent parsing the last device list
+
+    def _request(self, url, params=None, timeout=None):
+        """
+        Sends a request to the Fritz!Box and counts it
+        """
+        self.request_count += 1
+        return super()._request(url, params=params, timeout=timeout if timeout is not None else self.timeout)
+
+    @property
+    def logged_in(self):
+        return self._sid is not None
+
+    def _aha_request(self, cmd, ain=None, param=None, rf=str):
+        """
+        Sends an AHA request, logs in again if the SID is not valid anymore
+        """
+        return self._call_with_login(super()._aha_request, cmd, ain=ain, param=param, rf=rf)
+
+    def _call_with_login(self, function, *args, **kwargs):
+        sid = self._sid
+        try:
+            return function(*args, **kwargs)
+        except HTTPError as e:
+            if e.response is None or e.response.status_code != 403:
+                raise
+        with self._login_lock:
+            # another thread may already have renewed the SID
+            if self._sid == sid:
+                self.login()
+                self.relogin_count += 1
+        return function(*args, **kwargs)
+
+    def login(self):
+        """
+        Logs in, gets a new SID and stores it in the SID file
+        """
+        super().login()
+        self.login_count += 1
+        self._write_sid_file()
+
+    def logout(self):
+        """
+        Logs out, the SID file is removed
+        """
+        super().logout()
+        self._write_sid_file()
+
+    def restore_sid(self):
+        """
+        Reads the SID from the SID file
+
+        The SID is not validated here. If it has expired, the first request logs in again.
+
+        :return: True, if a SID for this host and user has been read
+        """
+        if self._sid_file is None:
+            return False
+        try:
+            with open(self._sid_file, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get('host') != self._host or data.get('user') != self._user or not data.get('sid'):
+            return False
+        self._sid = data['sid']
+        return True
+
+    def close(self):
+        """
+        Closes the pooled HTTP connections without logging out, so the stored SID stays valid
+        """
+        self._session.close()
+
+    def _write_sid_file(self):
+        if self._sid_file is None:
+            return
+        if self._sid is None:
+            try:
+                os.remove(self._sid_file)
+            except OSError:
+                pass
+            return
+        os.makedirs(os.path.dirname(self._sid_file), exist_ok=True)
+        fd = os.open(self._sid_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'host': self._host, 'user': self._user, 'sid': self._sid}, f)
+
+    def apply_template(self, ain):
+        """
+        Applies a template configured at the Fritz!Box
+        """
+        return self._aha_request('applytemplate', ain=ain)
+
+    def get_device_info(self, ain, fields=None):
+        """
+        Fetches the values of one device (getdeviceinfos)
+
+        :param fields: collection of device attributes to be read (None = all fields)
+        :return: dict {ain: DeviceSnapshot}, empty if the AIN is unknown
+        """
+        text = self._aha_request('getdeviceinfos', ain=ain)
+        return parse_device_list([text.encode('utf-8')], {ain}, fields)
+
+    def get_basic_device_stats(self, ain):
+        """
+        Fetches the statistics of a device, the xml is returned as text to be parsed by DeviceStats
+        """
+        return self._aha_request('getbasicdevicestats', ain=ain)
+
+    def get_device_index(self, ains=None, fields=None, timeout=None):
+        """
+        Fetches the device list once and returns the devices with their AIN as key
+
+        The response is parsed while it is received. Only devices with one of the given AINs are
+        materialized and only the given fields are read.
+
+        :param ains: collection of AINs to be returned (None = all devices)
+        :param fields: collection of device attributes to be read (None = all fields)
+        :param timeout: timeout in seconds (None = attribute timeout)
+        :return: dict {ain: DeviceSnapshot}
+        """
+        if timeout is None:
+            timeout = self.timeout
+        return self._call_with_login(self._get_device_index, ains, fields, timeout)
+
+    def _get_device_index(self, ains, fields, timeout):
+        url = 'http://' + self._host + '/webservices/homeautoswitch.lua'
+        params = {'switchcmd': 'getdevicelistinfos', 'sid': self._sid}
+
+        self.request_count += 1
+        start = time.perf_counter()
+        receiving = [0.0]
+        with self._session.get(url, params=params, timeout=timeout, stream=True) as rsp:
+            rsp.raise_for_status()
+            receiving[0] = time.perf_counter() - start
+            devices = parse_device_list(self._timed(rsp.iter_content(chunk_size=8192), receiving), ains, fields)
+        self.fetch_time = receiving[0]
+        self.parse_time = time.perf_counter() - start - receiving[0]
+        return devices
+
+    @staticmethod
+    def _timed(chunks, receiving):
+        # adds the time spent waiting for the chunks of the response to receiving[0]
+        chunks = iter(chunks)
+        while True:
+            start = time.perf_counter()
+            chunk = next(chunks, None)
+            receiving[0] += time.perf_counter() - start
+            if chunk is None:
+                return
+            yield chunk
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  Copyright 2019-      <AUTHOR>                                  <EMAIL>
+#########################################################################
+#  This file is part of SmartHomeNG.
+#  https://www.smarthomeNG.de
+#  https://knx-user-forum.de/forum/supportforen/smarthome-py
+#
+#  SmartHomeNG is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SmartHomeNG is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SmartHomeNG. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+
+"""
+Circuit breaker for the requests to a Fritz!Box, which stops sending requests to an unreachable Fritz!Box
+"""
+
+import threading
+import time
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of sending a request while the circuit breaker is open
+    """
+
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker with the states closed, open and half_open
+
+    closed:    requests are sent. After `threshold` consecutive failures the breaker opens.
+    open:      requests are rejected with CircuitOpenError without contacting the Fritz!Box. After the backoff
+               time the breaker gets half open. The backoff starts with `backoff` seconds and is doubled each time
+               the breaker opens again, up to `max_backoff` seconds.
+    half_open: a single request is sent as probe, all others are rejected. If the probe succeeds, the breaker
+               closes and the backoff is reset, otherwise it opens again.
+
+    Every exception raised by a request counts as failure, except the `ignored` exception types, which show that
+    the Fritz!Box answered (e.g. it rejected an invalid AIN) and count as success.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, threshold=3, backoff=30, max_backoff=900, ignored=(), callback=None):
+        """
+        :param name: name of the breaker (host of the Fritz!Box) used in messages
+        :param threshold: number of consecutive failures opening the breaker
+        :param backoff: seconds the breaker stays open the first time
+        :param max_backoff: maximum seconds the breaker stays open
+        :param ignored: exception types counted as success, because the Fritz!Box answered the request
+        :param callback: function called with (breaker, old state, new state) after each state change
+        """
+        self.name = name
+        self.threshold = max(int(threshold), 1)
+        self.backoff = backoff
+        self.max_backoff = max(max_backoff, backoff)
+        self.ignored = tuple(ignored)
+        self._callback = callback
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0                    # consecutive failures
+        self._current_backoff = backoff
+        self._open_until = 0.0                # time.monotonic() at which the breaker gets half open
+        self._probing = False                 # a probe is in flight in state half_open
+        self.last_error = None
+        self.opened = 0                       # number of times the breaker opened
+
+    @property
+    def state(self):
+        return self._state
+
+    def is_open(self):
+        """
+        Checks without side effects, if requests are rejected at the moment
+        """
+        with self._lock:
+            if self._state == self.OPEN:
+                return time.monotonic() < self._open_until
+            return self._state == self.HALF_OPEN and self._probing
+
+    def allow(self):
+        """
+        Checks if a request may be sent; in state half_open the caller gets the only probe
+
+        Each allowed request has to be reported with success() or failure().
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() < self._open_until:
+                    return False
+                change = self._set_state(self.HALF_OPEN)
+            else:
+                change = None
+            if self._probing:
+                allowed = False
+            else:
+                allowed = self._probing = True
+        self._notify(change)
+        return allowed
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            change = None
+            if self._state != self.CLOSED:
+                self._current_backoff = self.backoff
+                change = self._set_state(self.CLOSED)
+        self._notify(change)
+
+    def failure(self, error=None):
+        with self._lock:
+            self._failures += 1
+            self.last_error = str(error) if error is not None else None
+            change = None
+            if self._state == self.HALF_OPEN:
+                # failed probe: stay away longer
+                self._current_backoff = min(self._current_backoff * 2, self.max_backoff)
+                change = self._open()
+            elif self._state == self.CLOSED and self._failures >= self.threshold:
+                change = self._open()
+            self._probing = False
+        self._notify(change)
+
+    def call(self, function, *args, **kwargs):
+        """
+        Calls function, if the breaker allows it, and records the result
+
+        :raises CircuitOpenError: if the breaker rejects the call
+        """
+        if not self.allow():
+            raise CircuitOpenError('Fritz!Box {} is not reachable, next try in {:.0f} s'.format(self.name, self.retry_in()))
+        try:
+            result = function(*args, **kwargs)
+        except self.ignored:
+            self.success()
+            raise
+        except BaseException as e:
+            self.failure(e)
+            raise
+        self.success()
+        return result
+
+    def retry_in(self):
+        """
+        Seconds until the breaker gets half open (0, if it is not open)
+        """
+        if self._state != self.OPEN:
+            return 0
+        return max(self._open_until - time.monotonic(), 0)
+
+    def as_dict(self):
+        return {'state': self._state, 'failures': self._failures, 'opened': self.opened,
+                'retry_in': round(self.retry_in()), 'last_error': self.last_error}
+
+    def _open(self):
+        # call with lock acquired
+        self._open_until = time.monotonic() + self._current_backoff
+        self.opened += 1
+        return self._set_state(self.OPEN)
+
+    def _set_state(self, state):
+        # call with lock acquired, returns the change to be passed to _notify
+        old, self._state = self._state, state
+        return (old, state) if old != state else None
+
+    def _notify(self, change):
+        if change is not None and self._callback is not None:
+            self._callback(self, *change)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  Copyright 2019-      <AUTHOR>                                  <EMAIL>
+#########################################################################
+#  This file is part of SmartHomeNG.
+#  https://www.smarthomeNG.de
+#  https://knx-user-forum.de/forum/supportforen/smarthome-py
+#
+#  SmartHomeNG is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SmartHomeNG is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SmartHomeNG. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+"""
+Queue for commands to the Fritz!Box, which are sent by background worker threads
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class CommandQueue(object):
+    """
+    Queue of commands, which are sent to the Fritz!Box by a bounded number of worker threads
+
+    Commands are identified by a key (ain, kind). A command put to the queue replaces a pending command with the
+    same key, so only the latest value is sent (e.g. a visu slider sending several temperatures in a second).
+    Commands for the same AIN are never sent concurrently and are sent in the order they were queued.
+    """
+
+    def __init__(self, workers=2, name='CommandQueue', logger=None, callback=None):
+        """
+        :param workers: number of worker threads sending the commands
+        :param name: name prefix of the worker threads
+        :param callback: function called after each command with (key, duration, latency, success)
+        """
+        self.logger = logger if logger is not None else logging.getLogger(__name__)
+        self._callback = callback
+        self._workers = workers
+        self._name = name
+        self._threads = []
+        self._pending = OrderedDict()             # key -> (description, function, time queued)
+        self._in_flight = set()                   # AINs with a command being sent
+        self._condition = threading.Condition()
+        self._running = False
+
+        self.sent = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.latency = deque(maxlen=100)          # seconds from queueing to completion of the last commands
+
+    def start(self):
+        """
+        Starts the worker threads
+        """
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        for number in range(self._workers):
+            thread = threading.Thread(target=self._worker, name='{}.{}'.format(self._name, number), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=5):
+        """
+        Stops the worker threads, pending commands are discarded
+        """
+        with self._condition:
+            self._running = False
+            self._pending.clear()
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def put(self, key, description, function):
+        """
+        Puts a command to the queue
+
+        :param key: tuple (ain, kind); a pending command with the same key is replaced
+        :param description: description of the command for logging
+        :param function: callable without arguments, which sends the command
+        """
+        with self._condition:
+            previous = self._pending.pop(key, None)
+            if previous is not None:
+                self.coalesced += 1
+                self.logger.debug('Command {} replaces pending command {}'.format(description, previous[0]))
+                queued = previous[2]
+            else:
+                queued = time.monotonic()
+            self._pending[key] = (description, function, queued)
+            self._condition.notify_all()
+
+    def join(self, timeout=None):
+        """
+        Waits until all pending commands have been sent
+
+        :param timeout: maximum time to wait in seconds (None = wait forever)
+        :return: True, if all commands have been sent
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._pending and not self._in_flight, timeout)
+
+    @property
+    def depth(self):
+        """
+        Number of pending commands
+        """
+        return len(self._pending)
+
+    def _next(self):
+        # returns the first pending command, whose AIN has no command in flight (call with condition acquired)
+        for key in self._pending:
+            if key[0] not in self._in_flight:
+                return key, self._pending.pop(key)
+        return None, None
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                key, command = self._next()
+                while self._running and key is None:
+                    self._condition.wait()
+                    key, command = self._next()
+                if not self._running:
+                    return
+                self._in_flight.add(key[0])
+
+            description, function, queued = command
+            start = time.monotonic()
+            success = True
+            try:
+                function()
+                self.sent += 1
+            except Exception as e:
+                success = False
+                self.failed += 1
+                self.logger.error('Command {} failed: {}'.format(description, e))
+            end = time.monotonic()
+            self.latency.append(end - queued)
+            if self._callback is not None:
+                self._callback(key, end - start, end - queued, success)
+
+            with self._condition:
+                self._in_flight.discard(key[0])
+                self._condition.notify_all()
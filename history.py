@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  Copyright 2019-      <AUTHOR>                                  <EMAIL>
+#########################################################################
+#  This file is part of SmartHomeNG.
+#  https://www.smarthomeNG.de
+#  https://knx-user-forum.de/forum/supportforen/smarthome-py
+#
+#  SmartHomeNG is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SmartHomeNG is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SmartHomeNG. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+
+"""
+History of the power, energy and voltage values of the devices with min/max/avg over sliding time windows
+"""
+
+import math
+import os
+import struct
+import time
+from array import array
+
+# windows of the statistics: name -> length in seconds
+WINDOWS = {'1m': 60, '15m': 900, '1h': 3600, '24h': 86400}
+
+# device attributes with a history
+METRICS = ('power', 'energy', 'voltage')
+
+STATISTICS = ('min', 'max', 'avg')
+
+# number of buckets a window is divided into
+BUCKETS = 60
+
+
+class WindowStats(object):
+    """
+    Min, max and average of the samples of a sliding time window
+
+    The window is divided into BUCKETS buckets kept in a ring of arrays, each bucket holds start time, count, sum,
+    minimum and maximum of its samples. A sample only updates its bucket, so adding a sample costs O(1) and
+    the memory used is fixed, independent of the poll interval. The statistics are combined from the buckets
+    within the window, so the window slides with the resolution of one bucket.
+    """
+
+    __slots__ = ('length', 'bucket_length', 'start', 'count', 'sum', 'min', 'max')
+
+    def __init__(self, length, buckets=BUCKETS):
+        self.length = length
+        self.bucket_length = length / buckets
+        self.start = array('d', [-math.inf]) * buckets
+        self.count = array('L', [0]) * buckets
+        self.sum = array('d', [0.0]) * buckets
+        self.min = array('d', [0.0]) * buckets
+        self.max = array('d', [0.0]) * buckets
+
+    def add(self, timestamp, value):
+        number = int(timestamp // self.bucket_length)
+        index = number % len(self.start)
+        start = number * self.bucket_length
+        if self.start[index] != start:
+            # the bucket belongs to an older round of the ring: reuse it
+            self.start[index] = start
+            self.count[index] = 1
+            self.sum[index] = self.min[index] = self.max[index] = value
+            return
+        self.count[index] += 1
+        self.sum[index] += value
+        if value < self.min[index]:
+            self.min[index] = value
+        if value > self.max[index]:
+            self.max[index] = value
+
+    def stats(self, now):
+        """
+        :return: dict with min, max and avg of the samples within the window, None if there are none
+        """
+        oldest = now - self.length
+        count = 0
+        total = 0.0
+        minimum = math.inf
+        maximum = -math.inf
+        for index, start in enumerate(self.start):
+            if start + self.bucket_length > oldest and start <= now and self.count[index]:
+                count += self.count[index]
+                total += self.sum[index]
+                minimum = min(minimum, self.min[index])
+                maximum = max(maximum, self.max[index])
+        if not count:
+            return None
+        return {'min': minimum, 'max': maximum, 'avg': total / count}
+
+    def arrays(self):
+        return (self.start, self.count, self.sum, self.min, self.max)
+
+
+class History(object):
+    """
+    Statistics of power, energy and voltage per AIN for all windows of WINDOWS
+    """
+
+    SNAPSHOT_MAGIC = b'AVMH1'
+
+    def __init__(self):
+        self._stats = {}                      # (ain, metric) -> {window name: WindowStats}
+
+    def add_ain(self, ain):
+        """
+        Keeps the history of an AIN
+        """
+        for metric in METRICS:
+            if (ain, metric) not in self._stats:
+                self._stats[(ain, metric)] = {name: WindowStats(length) for name, length in WINDOWS.items()}
+
+    def __contains__(self, ain):
+        return (ain, METRICS[0]) in self._stats
+
+    def __len__(self):
+        return len(self._stats) // len(METRICS)
+
+    def ains(self):
+        return sorted({ain for ain, metric in self._stats})
+
+    def add(self, ain, device, timestamp=None):
+        """
+        Adds the values of a device read from the device list
+
+        :param device: DeviceSnapshot; attributes which have not been read (None) are skipped
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        for metric in METRICS:
+            value = getattr(device, metric)
+            if value is not None:
+                for window in self._stats[(ain, metric)].values():
+                    window.add(timestamp, value)
+
+    def get(self, ain, metric, window, statistic, now=None):
+        """
+        :return: statistic (min, max or avg) of a metric of an AIN within a window, None if there are no samples
+        """
+        stats = self._stats[(ain, metric)][window].stats(time.time() if now is None else now)
+        return round(stats[statistic], 3) if stats is not None else None
+
+    def as_dict(self, now=None):
+        """
+        Returns all statistics, e.g. to be sent as json to the web interface
+
+        :return: dict {ain: {metric: {window: {'min', 'max', 'avg'} or None}}}
+        """
+        if now is None:
+            now = time.time()
+        result = {}
+        for (ain, metric), windows in self._stats.items():
+            result.setdefault(ain, {})[metric] = {
+                name: {key: round(value, 3) for key, value in stats.items()} if stats is not None else None
+                for name, stats in ((name, window.stats(now)) for name, window in windows.items())}
+        return result
+
+    def save(self, filename):
+        """
+        Writes the buckets of all windows to a file, so the history survives a restart
+
+        The snapshot is written to a temporary file first, so an interrupted write never replaces a valid snapshot.
+        """
+        temporary = filename + '.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(self.SNAPSHOT_MAGIC)
+            f.write(struct.pack('<II', len(self._stats), BUCKETS))
+            for (ain, metric), windows in self._stats.items():
+                key = '{}\t{}'.format(ain, metric).encode('utf-8')
+                f.write(struct.pack('<H', len(key)))
+                f.write(key)
+                for name in WINDOWS:
+                    for values in windows[name].arrays():
+                        f.write(values.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, filename)
+
+    def load(self, filename):
+        """
+        Reads the buckets written by save() for the AINs kept by this history
+
+        The whole file is validated before any window is changed, so an invalid or truncated snapshot
+        leaves the history untouched.
+
+        :raises ValueError: if the file is not a complete snapshot
+        :return: number of histories read
+        """
+        with open(filename, 'rb') as f:
+            data = f.read()
+
+        def read(size):
+            nonlocal offset
+            if offset + size > len(data):
+                raise ValueError('{} is truncated'.format(filename))
+            chunk = data[offset:offset + size]
+            offset += size
+            return chunk
+
+        offset = 0
+        if read(len(self.SNAPSHOT_MAGIC)) != self.SNAPSHOT_MAGIC:
+            raise ValueError('{} is not a history snapshot'.format(filename))
+        entries, buckets = struct.unpack('<II', read(8))
+        if buckets != BUCKETS:
+            raise ValueError('{} has {} buckets instead of {}'.format(filename, buckets, BUCKETS))
+        typecodes = [values.typecode for values in WindowStats(1).arrays()]
+        snapshot = {}                         # (ain, metric) -> {window name: list of arrays}
+        for _ in range(entries):
+            size, = struct.unpack('<H', read(2))
+            try:
+                ain, metric = read(size).decode('utf-8').split('\t')
+            except (UnicodeDecodeError, ValueError):
+                raise ValueError('{} has an invalid entry'.format(filename))
+            windows = {}
+            for name in WINDOWS:
+                windows[name] = []
+                for typecode in typecodes:
+                    values = array(typecode)
+                    values.frombytes(read(values.itemsize * BUCKETS))
+                    windows[name].append(values)
+            snapshot[(ain, metric)] = windows
+        if offset != len(data):
+            raise ValueError('{} has {} unexpected bytes at the end'.format(filename, len(data) - offset))
+
+        loaded = 0
+        for key, windows in snapshot.items():
+            current = self._stats.get(key)
+            if current is None:
+                continue
+            for name, arrays in windows.items():
+                for values, loaded_values in zip(current[name].arrays(), arrays):
+                    values[:] = loaded_values
+            loaded += 1
+        return loaded // len(METRICS)
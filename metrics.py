@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  Copyright 2019-      <AUTHOR>                                  <EMAIL>
+#########################################################################
+#  This file is part of SmartHomeNG.
+#  https://www.smarthomeNG.de
+#  https://knx-user-forum.de/forum/supportforen/smarthome-py
+#
+#  SmartHomeNG is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SmartHomeNG is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SmartHomeNG. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+"""
+Timings and counters of the plugin, kept in fixed-size ring buffers
+"""
+
+from collections import deque
+
+
+def summarize(buffer):
+    """
+    Returns last, average and maximum of a buffer of durations in milliseconds
+
+    :param buffer: deque of durations in seconds
+    :return: dict with keys last, avg, max and count
+    """
+    if not buffer:
+        return {'last': None, 'avg': None, 'max': None, 'count': 0}
+    return {'last': round(buffer[-1] * 1000, 1),
+            'avg': round(sum(buffer) / len(buffer) * 1000, 1),
+            'max': round(max(buffer) * 1000, 1),
+            'count': len(buffer)}
+
+
+def rate(part, total):
+    return round(part / total, 4) if total else 0.0
+
+
+class AinMetrics(object):
+    """
+    Timings of one device
+    """
+
+    __slots__ = ('fetch', 'command')
+
+    def __init__(self, size):
+        self.fetch = deque(maxlen=size)           # duration of the device list queries serving the device
+        self.command = deque(maxlen=size)         # duration of the commands sent to the device
+
+
+class Metrics(object):
+    """
+    Timings of the poll cycles and commands of the plugin
+
+    All durations are kept in ring buffers of the last `size` values, so the memory used is bounded.
+    """
+
+    PHASES = ('total', 'fetch', 'parse', 'write')
+
+    def __init__(self, size=100):
+        self.size = size
+        self.phases = {phase: deque(maxlen=size) for phase in self.PHASES}
+        self.ains = {}
+        self.cycles = 0
+        self.cycle_errors = 0
+        self.commands = 0
+        self.command_errors = 0
+
+    def ain(self, ain):
+        metrics = self.ains.get(ain)
+        if metrics is None:
+            metrics = self.ains[ain] = AinMetrics(self.size)
+        return metrics
+
+    def add_cycle(self, total, fetch, parse, write, ains):
+        """
+        Records the timing of a successful poll cycle
+
+        :param ains: dict {ain: seconds} with the fetch and parse time of the device list serving each AIN of the
+                     cycle (the device list of its Fritz!Box)
+        """
+        self.cycles += 1
+        self.phases['total'].append(total)
+        self.phases['fetch'].append(fetch)
+        self.phases['parse'].append(parse)
+        self.phases['write'].append(write)
+        for ain, duration in ains.items():
+            self.ain(ain).fetch.append(duration)
+
+    def add_cycle_error(self):
+        self.cycles += 1
+        self.cycle_errors += 1
+
+    def add_command(self, key, duration, latency, success):
+        """
+        Records a command sent by the command queue (used as callback of CommandQueue)
+        """
+        self.commands += 1
+        if not success:
+            self.command_errors += 1
+        self.ain(key[0]).command.append(duration)
+
+    def as_dict(self):
+        """
+        Returns all metrics as dict (durations in milliseconds), e.g. to be sent as json to the web interface
+        """
+        return {
+            'cycles': self.cycles,
+            'cycle_errors': self.cycle_errors,
+            'cycle_error_rate': rate(self.cycle_errors, self.cycles),
+            'commands': self.commands,
+            'command_errors': self.command_errors,
+            'command_error_rate': rate(self.command_errors, self.commands),
+            'phases': {phase: summarize(buffer) for phase, buffer in self.phases.items()},
+            'ains': {ain: {'fetch': summarize(metrics.fetch), 'command': summarize(metrics.command)}
+                     for ain, metrics in self.ains.items()},
+        }
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  Copyright 2019-      <AUTHOR>                                  <EMAIL>
+#########################################################################
+#  This file is part of SmartHomeNG.
+#  https://www.smarthomeNG.de
+#  https://knx-user-forum.de/forum/supportforen/smarthome-py
+#
+#  SmartHomeNG is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SmartHomeNG is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SmartHomeNG. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+import unittest
+import xml.dom.minidom
+
+from pyfritzhome.fritzhome import FritzhomeDevice
+
+from aha import DEVICE_FIELDS, DEVICE_XML_ATTRIBUTES, parse_device_list
+from devicelist import make_ain, make_device_list
+
+CAPABILITIES = ('has_alarm', 'has_thermostat', 'has_powermeter', 'has_temperature_sensor', 'has_switch')
+
+
+def parse_pyfritzhome(plain):
+    dom = xml.dom.minidom.parseString(plain)
+    return {device.ain: device for device in (FritzhomeDevice(node=node) for node in dom.getElementsByTagName('device'))}
+
+
+def parse_chunked(plain, ains=None, fields=None, size=100):
+    data = plain.encode()
+    return parse_device_list((data[i:i + size] for i in range(0, len(data), size)), ains, fields)
+
+
+class TestParseDeviceList(unittest.TestCase):
+
+    def setUp(self):
+        self.plain = make_device_list(switches=5, thermostats=5, alarms=2, seed=1)
+
+    def test_same_values_as_pyfritzhome(self):
+        expected = parse_pyfritzhome(self.plain)
+        devices = parse_chunked(self.plain)
+        self.assertEqual(set(devices), set(expected))
+        for ain, device in expected.items():
+            for attribute in tuple(DEVICE_XML_ATTRIBUTES) + tuple(DEVICE_FIELDS) + CAPABILITIES:
+                if not hasattr(device, attribute):
+                    continue
+                if attribute == 'lock' and device.has_switch:
+                    # pyfritzhome 0.4.2 reads the lock of a switch with bool('0'), which is always True
+                    continue
+                with self.subTest(ain=ain, attribute=attribute):
+                    self.assertEqual(getattr(devices[ain], attribute), getattr(device, attribute))
+
+    def test_only_requested_devices_and_fields(self):
+        ains = {make_ain('switch', 1), make_ain('thermostat', 2), '99999 9999999'}
+        devices = parse_chunked(self.plain, ains, {'power', 'unknown'})
+        self.assertEqual(set(devices), ains - {'99999 9999999'})
+        switch = devices[make_ain('switch', 1)]
+        self.assertIsNotNone(switch.power)
+        self.assertIsNotNone(switch.name)
+        self.assertIsNone(switch.energy)
+        self.assertIsNone(devices[make_ain('thermostat', 2)].power)
+
+
+if __name__ == '__main__':
+    unittest.main()
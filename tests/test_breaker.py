@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  Copyright 2019-      <AUTHOR>                                  <EMAIL>
+#########################################################################
+#  This file is part of SmartHomeNG.
+#  https://www.smarthomeNG.de
+#  https://knx-user-forum.de/forum/supportforen/smarthome-py
+#
+#  SmartHomeNG is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SmartHomeNG is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SmartHomeNG. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+import unittest
+from unittest import mock
+
+from breaker import CircuitBreaker, CircuitOpenError
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def fail():
+    raise OSError('timeout')
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch('breaker.time.monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.changes = []
+        self.breaker = CircuitBreaker('fritz.box', threshold=2, backoff=10, max_backoff=30, ignored=(KeyError,),
+                                      callback=lambda breaker, old, new: self.changes.append((old, new)))
+
+    def trip(self):
+        for _ in range(self.breaker.threshold):
+            with self.assertRaises(OSError):
+                self.breaker.call(fail)
+
+    def test_opens_after_threshold(self):
+        with self.assertRaises(OSError):
+            self.breaker.call(fail)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        with self.assertRaises(OSError):
+            self.breaker.call(fail)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertTrue(self.breaker.is_open())
+        self.assertEqual(self.breaker.last_error, 'timeout')
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.call(lambda: 'not sent')
+
+    def test_success_resets_failures(self):
+        with self.assertRaises(OSError):
+            self.breaker.call(fail)
+        self.assertEqual(self.breaker.call(lambda: 'ok'), 'ok')
+        with self.assertRaises(OSError):
+            self.breaker.call(fail)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_allows_single_probe(self):
+        self.trip()
+        self.clock.now += 10
+        self.assertFalse(self.breaker.is_open())
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.assertTrue(self.breaker.is_open())
+
+    def test_failed_probes_double_backoff(self):
+        self.trip()
+        self.assertEqual(self.breaker.retry_in(), 10)
+        for backoff in (20, 30, 30):
+            self.clock.now += self.breaker.retry_in()
+            with self.assertRaises(OSError):
+                self.breaker.call(fail)
+            self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+            self.assertEqual(self.breaker.retry_in(), backoff)
+        self.assertEqual(self.breaker.opened, 4)
+
+    def test_successful_probe_closes_and_resets_backoff(self):
+        self.trip()
+        self.clock.now += 10
+        with self.assertRaises(OSError):
+            self.breaker.call(fail)
+        self.clock.now += 20
+        self.assertEqual(self.breaker.call(lambda: 'ok'), 'ok')
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(self.changes, [('closed', 'open'), ('open', 'half_open'), ('half_open', 'open'),
+                                        ('open', 'half_open'), ('half_open', 'closed')])
+        self.trip()
+        self.assertEqual(self.breaker.retry_in(), 10)
+
+    def test_ignored_exceptions_count_as_success(self):
+        self.trip()
+        self.clock.now += 10
+        with self.assertRaises(KeyError):
+            self.breaker.call(mock.Mock(side_effect=KeyError('inval')))
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_other_exceptions_count_as_failure(self):
+        for _ in range(2):
+            with self.assertRaises(AttributeError):
+                self.breaker.call(mock.Mock(side_effect=AttributeError('parsers')))
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+
+if __name__ == '__main__':
+    unittest.main()
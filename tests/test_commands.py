@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  Copyright 2019-      <AUTHOR>                                  <EMAIL>
+#########################################################################
+#  This file is part of SmartHomeNG.
+#  https://www.smarthomeNG.de
+#  https://knx-user-forum.de/forum/supportforen/smarthome-py
+#
+#  SmartHomeNG is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SmartHomeNG is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SmartHomeNG. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+import itertools
+import threading
+import time
+import unittest
+
+from commands import CommandQueue
+
+
+class TestCommandQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = CommandQueue(workers=3, name='test')
+        self.addCleanup(self.queue.stop)
+        self.lock = threading.Lock()
+        self.sent = []
+        self.active = set()
+        self.overlaps = []
+
+    def command(self, ain, value, duration=0.0):
+        def send():
+            with self.lock:
+                if ain in self.active:
+                    self.overlaps.append((ain, value))
+                self.active.add(ain)
+            time.sleep(duration)
+            with self.lock:
+                self.active.discard(ain)
+                self.sent.append((ain, value))
+        return send
+
+    def test_pending_command_is_replaced(self):
+        for value in (18, 19, 20):
+            self.queue.put(('A', 'temperature'), 'temperature {}'.format(value), self.command('A', value))
+        self.queue.put(('A', 'switch'), 'switch on', self.command('A', True))
+        self.queue.start()
+        self.assertTrue(self.queue.join(5))
+        self.assertEqual(self.sent, [('A', 20), ('A', True)])
+        self.assertEqual(self.queue.coalesced, 2)
+        self.assertEqual(self.queue.sent, 2)
+        self.assertEqual(len(self.queue.latency), 2)
+
+    def test_commands_of_an_ain_are_sent_in_order(self):
+        for kind in ('switch', 'temperature', 'template'):
+            for ain in ('A', 'B'):
+                self.queue.put((ain, kind), kind, self.command(ain, kind, 0.02))
+        self.queue.start()
+        self.assertTrue(self.queue.join(5))
+        self.assertEqual(self.overlaps, [])
+        for ain in ('A', 'B'):
+            self.assertEqual([value for sent_ain, value in self.sent if sent_ain == ain], ['switch', 'temperature', 'template'])
+
+    def test_toggles_are_never_merged(self):
+        # the plugin makes each toggle key unique, as two toggles cancel each other
+        count = itertools.count()
+        for _ in range(3):
+            self.queue.put(('A', 'toggle', next(count)), 'toggle', self.command('A', 'toggle'))
+        self.queue.start()
+        self.assertTrue(self.queue.join(5))
+        self.assertEqual(self.sent, [('A', 'toggle')] * 3)
+        self.assertEqual(self.queue.coalesced, 0)
+
+    def test_failed_command_is_counted(self):
+        def fail():
+            raise OSError('timeout')
+        self.queue.start()
+        self.queue.put(('A', 'switch'), 'switch on', fail)
+        self.queue.put(('A', 'temperature'), 'temperature 20', self.command('A', 20))
+        self.assertTrue(self.queue.join(5))
+        self.assertEqual(self.queue.failed, 1)
+        self.assertEqual(self.sent, [('A', 20)])
+
+
+if __name__ == '__main__':
+    unittest.main()
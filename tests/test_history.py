@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  Copyright 2019-      <AUTHOR>                                  <EMAIL>
+#########################################################################
+#  This file is part of SmartHomeNG.
+#  https://www.smarthomeNG.de
+#  https://knx-user-forum.de/forum/supportforen/smarthome-py
+#
+#  SmartHomeNG is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SmartHomeNG is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SmartHomeNG. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+import os
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from history import History, WINDOWS
+
+
+class TestHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.filename = os.path.join(self.directory, 'history.bin')
+        self.now = 1600000000.0
+        self.history = History()
+        for ain in ('08761 0000001', '08761 0000002'):
+            self.history.add_ain(ain)
+        for second in range(-7200, 10, 10):
+            self.history.add('08761 0000001', SimpleNamespace(power=second % 100, energy=second + 7200, voltage=230.0), self.now + second)
+            self.history.add('08761 0000002', SimpleNamespace(power=None, energy=None, voltage=None), self.now + second)
+
+    def test_statistics(self):
+        self.assertEqual(self.history.get('08761 0000001', 'power', '1m', 'max', self.now), 90)
+        self.assertEqual(self.history.get('08761 0000001', 'energy', '1h', 'max', self.now), 7200)
+        self.assertEqual(self.history.get('08761 0000001', 'voltage', '24h', 'avg', self.now), 230)
+        self.assertIsNone(self.history.get('08761 0000002', 'power', '1m', 'avg', self.now))
+
+    def test_snapshot_round_trip(self):
+        self.history.save(self.filename)
+        self.assertFalse(os.path.exists(self.filename + '.tmp'))
+        loaded = History()
+        loaded.add_ain('08761 0000001')
+        self.assertEqual(loaded.load(self.filename), 1)
+        expected = self.history.as_dict(self.now)['08761 0000001']
+        self.assertEqual(loaded.as_dict(self.now), {'08761 0000001': expected})
+        self.assertEqual(set(expected['power']), set(WINDOWS))
+
+    def test_truncated_snapshot_is_rejected(self):
+        self.history.save(self.filename)
+        with open(self.filename, 'rb') as f:
+            data = f.read()
+        loaded = History()
+        loaded.add_ain('08761 0000001')
+        for size in (3, 10, len(data) // 2, len(data) - 1):
+            with open(self.filename, 'wb') as f:
+                f.write(data[:size])
+            with self.assertRaises(ValueError):
+                loaded.load(self.filename)
+            self.assertIsNone(loaded.get('08761 0000001', 'power', '24h', 'avg', self.now))
+
+    def test_invalid_snapshot_is_rejected(self):
+        self.history.save(self.filename)
+        with open(self.filename, 'ab') as f:
+            f.write(b'\0')
+        with self.assertRaises(ValueError):
+            History().load(self.filename)
+        with open(self.filename, 'wb') as f:
+            f.write(b'no snapshot')
+        with self.assertRaises(ValueError):
+            History().load(self.filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
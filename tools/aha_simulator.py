@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  This file is part of SmartHomeNG.
+#
+#  SmartHomeNG is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SmartHomeNG is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SmartHomeNG. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+"""
+Local stand-in for the AHA HTTP interface of a Fritz!Box
+
+Implements login_sid.lua (challenge-response login) and the commands of webservices/homeautoswitch.lua used by
+the plugin (including getbasicdevicestats). Devices are generated by tools/devicelist.py. Latency and errors can be injected.
+
+Usage:
+    python3 tools/aha_simulator.py --port 8080 --switches 20 --thermostats 20 --alarms 5 --latency 0.05 --error-rate 0.01
+
+Configure the plugin with host: 127.0.0.1:8080. The number of requests served is returned by /simulator_stats.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from devicelist import TEMPLATES, make_devices, render_device_list
+
+INVALID_SID = '0000000000000000'
+
+
+class Simulator(object):
+    """
+    State of the simulated Fritz!Box
+    """
+
+    def __init__(self, devices, user='smarthome', password='secret', latency=0.0, jitter=0.0, error_rate=0.0,
+                 sid_timeout=1200, vary=False, seed=None):
+        """
+        :param devices: list of devices as returned by devicelist.make_devices()
+        :param latency: delay of each response in seconds
+        :param jitter: maximum random delay added to latency in seconds
+        :param error_rate: fraction of requests answered with HTTP 500
+        :param sid_timeout: seconds after which an unused SID expires
+        :param vary: change power values and temperatures with each device list query
+        """
+        self.devices = devices
+        self.by_ain = {device['ain']: device for device in devices}
+        self.user = user
+        self.password = password
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.sid_timeout = sid_timeout
+        self.vary = vary
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.sids = {}                        # sid -> time of last use
+        self.challenge = None
+        self.stats = {'requests': 0, 'logins': 0, 'errors': 0, 'forbidden': 0, 'commands': {}}
+
+    def new_challenge(self):
+        self.challenge = '{:08x}'.format(self.random.getrandbits(32))
+        return self.challenge
+
+    def check_response(self, response):
+        to_hash = (self.challenge + '-' + self.password).encode('UTF-16LE')
+        return response == '{}-{}'.format(self.challenge, hashlib.md5(to_hash).hexdigest())
+
+    def new_sid(self):
+        sid = '{:016x}'.format(self.random.getrandbits(64))
+        self.sids[sid] = time.monotonic()
+        return sid
+
+    def valid_sid(self, sid):
+        used = self.sids.get(sid)
+        if used is None:
+            return False
+        if time.monotonic() - used > self.sid_timeout:
+            del self.sids[sid]
+            return False
+        self.sids[sid] = time.monotonic()
+        return True
+
+    def device_stats(self, device):
+        """
+        Returns the xml of getbasicdevicestats for a device, the series are derived from its current values
+        """
+        def stats(count, grid, value, spread):
+            values = ','.join(str(max(0, value + self.random.randint(-spread, spread))) for _ in range(count))
+            return '<stats count="{}" grid="{}">{}</stats>'.format(count, grid, values)
+
+        parts = ['<devicestats>']
+        if device['kind'] == 'switch':
+            parts.append('<temperature>{}</temperature>'.format(stats(96, 900, device['celsius'], 5)))
+            parts.append('<voltage>{}</voltage>'.format(stats(360, 10, device['voltage'], 2000)))
+            parts.append('<power>{}</power>'.format(stats(360, 10, device['power'] // 10, 500)))
+            parts.append('<energy>{}{}</energy>'.format(stats(12, 2678400, 20000, 10000), stats(31, 86400, 600, 300)))
+        elif device['kind'] == 'thermostat':
+            parts.append('<temperature>{}</temperature>'.format(stats(96, 900, device['tist'] * 5, 10)))
+        parts.append('</devicestats>')
+        return ''.join(parts)
+
+    def vary_devices(self):
+        for device in self.devices:
+            if device['kind'] == 'switch' and device['state']:
+                device['power'] = max(0, device['power'] + self.random.randint(-5000, 5000))
+                device['energy'] += self.random.randint(0, 10)
+            elif device['kind'] == 'thermostat':
+                device['tist'] = min(max(device['tist'] + self.random.randint(-1, 1), 32), 56)
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def simulator(self):
+        return self.server.simulator
+
+    def log_message(self, format, *args):
+        pass
+
+    def send(self, code, body, content_type='text/xml'):
+        data = body.encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', content_type + '; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        simulator = self.simulator
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        if url.path == '/simulator_stats':
+            with simulator.lock:
+                self.send(200, json.dumps(simulator.stats), 'application/json')
+            return
+
+        with simulator.lock:
+            simulator.stats['requests'] += 1
+            failed = simulator.random.random() < simulator.error_rate
+            delay = simulator.latency + simulator.random.uniform(0, simulator.jitter)
+        if delay:
+            time.sleep(delay)
+        if failed:
+            with simulator.lock:
+                simulator.stats['errors'] += 1
+            self.send(500, 'Internal Server Error', 'text/plain')
+            return
+
+        if url.path == '/login_sid.lua':
+            self.login(params)
+        elif url.path == '/webservices/homeautoswitch.lua':
+            self.homeautoswitch(params)
+        else:
+            self.send(404, 'Not Found', 'text/plain')
+
+    def login(self, params):
+        simulator = self.simulator
+        with simulator.lock:
+            sid = INVALID_SID
+            if 'security:command/logout' in params:
+                simulator.sids.pop(params.get('sid'), None)
+            elif 'response' in params:
+                if params.get('username') == simulator.user and simulator.check_response(params['response']):
+                    sid = simulator.new_sid()
+                    simulator.stats['logins'] += 1
+            elif simulator.valid_sid(params.get('sid')):
+                sid = params['sid']
+            challenge = simulator.new_challenge()
+        self.send(200, '<?xml version="1.0" encoding="utf-8"?><SessionInfo><SID>{}</SID><Challenge>{}</Challenge>'
+                       '<BlockTime>0</BlockTime><Rights></Rights></SessionInfo>'.format(sid, challenge))
+
+    def homeautoswitch(self, params):
+        simulator = self.simulator
+        cmd = params.get('switchcmd')
+        with simulator.lock:
+            if not simulator.valid_sid(params.get('sid')):
+                simulator.stats['forbidden'] += 1
+                forbidden = True
+            else:
+                forbidden = False
+                simulator.stats['commands'][cmd] = simulator.stats['commands'].get(cmd, 0) + 1
+                device = simulator.by_ain.get(params.get('ain'))
+                body = self.aha_command(cmd, device, params.get('param'), params.get('ain'))
+        if forbidden:
+            self.send(403, 'Forbidden', 'text/plain')
+        elif body is None:
+            self.send(400, 'Bad Request', 'text/plain')
+        else:
+            self.send(200, body + '\n', 'text/plain' if not body.startswith('<') else 'text/xml')
+
+    def aha_command(self, cmd, device, param, param_ain=None):
+        # called with simulator.lock acquired, returns the response body or None for an invalid request
+        simulator = self.simulator
+        if cmd == 'getdevicelistinfos':
+            if simulator.vary:
+                simulator.vary_devices()
+            return render_device_list(simulator.devices)
+        if cmd == 'getswitchlist':
+            return ','.join(device['ain'].replace(' ', '') for device in simulator.devices if device['kind'] == 'switch')
+        if cmd == 'applytemplate':
+            return '' if device is None and str(param_ain).startswith('tmp') else 'inval'
+        if device is None:
+            return 'inval' if cmd in ('setswitchon', 'setswitchoff', 'setswitchtoggle', 'sethkrtsoll') else None
+        if cmd in ('setswitchon', 'setswitchoff', 'setswitchtoggle'):
+            if device['kind'] != 'switch':
+                return 'inval'
+            device['state'] = {'setswitchon': 1, 'setswitchoff': 0, 'setswitchtoggle': 1 - device['state']}[cmd]
+            return str(device['state'])
+        if cmd == 'sethkrtsoll':
+            if device['kind'] != 'thermostat' or param is None:
+                return 'inval'
+            device['tsoll'] = int(param)
+            return ''
+        if cmd == 'getswitchstate':
+            return str(device.get('state', 'inval'))
+        if cmd == 'gethkrtsoll':
+            return str(device.get('tsoll', 'inval'))
+        if cmd == 'getdeviceinfos':
+            return TEMPLATES[device['kind']].format(**device)
+        if cmd == 'getbasicdevicestats':
+            return simulator.device_stats(device)
+        return None
+
+
+def make_server(host='127.0.0.1', port=0, **kwargs):
+    """
+    Creates the HTTP server of a simulated Fritz!Box
+
+    :param port: port to listen on (0 = any free port, see server.server_port)
+    :param kwargs: number of devices (switches, thermostats, alarms, seed) and arguments of Simulator
+    :return: ThreadingHTTPServer with attribute simulator
+    """
+    devices = make_devices(kwargs.pop('switches', 10), kwargs.pop('thermostats', 10), kwargs.pop('alarms', 0), kwargs.get('seed'))
+    server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.daemon_threads = True
+    server.simulator = Simulator(devices, **kwargs)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--switches', type=int, default=10)
+    parser.add_argument('--thermostats', type=int, default=10)
+    parser.add_argument('--alarms', type=int, default=0)
+    parser.add_argument('--user', default='smarthome')
+    parser.add_argument('--password', default='secret')
+    parser.add_argument('--latency', type=float, default=0.0, help='delay of each response in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='maximum random delay added to latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with HTTP 500')
+    parser.add_argument('--sid-timeout', type=float, default=1200, help='seconds after which an unused SID expires')
+    parser.add_argument('--vary', action='store_true', help='change power values and temperatures with each query')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, switches=args.switches, thermostats=args.thermostats, alarms=args.alarms,
+                         user=args.user, password=args.password, latency=args.latency, jitter=args.jitter,
+                         error_rate=args.error_rate, sid_timeout=args.sid_timeout, vary=args.vary, seed=args.seed)
+    print('Simulated Fritz!Box with {} devices listening on {}:{}'.format(len(server.simulator.devices), args.host, server.server_port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
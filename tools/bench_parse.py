@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  This file is part of SmartHomeNG.
+#
+#  SmartHomeNG is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SmartHomeNG is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SmartHomeNG. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+"""
+Compares parsing of a getdevicelistinfos response by pyfritzhome with the incremental parser of the plugin
+
+Usage:
+    python3 tools/bench_parse.py [--xml recorded_devicelist.xml] [--devices 500] [--configured 10]
+
+Without --xml a synthetic device list is generated.
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+import xml.dom.minidom
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from pyfritzhome.fritzhome import FritzhomeDevice
+
+from aha import parse_device_list
+from devicelist import make_device_list
+
+
+def parse_pyfritzhome(plain):
+    dom = xml.dom.minidom.parseString(plain)
+    return {device.ain: device for device in (FritzhomeDevice(node=node) for node in dom.getElementsByTagName('device'))}
+
+
+def parse_incremental(plain, ains, fields):
+    data = plain.encode()
+    return parse_device_list((data[i:i + 8192] for i in range(0, len(data), 8192)), ains, fields)
+
+
+def measure(name, function, repeat):
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    duration = (time.perf_counter() - start) / repeat
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print('{:<14} {:>10.2f} ms/parse {:>10.1f} KiB peak  {:>5} devices'.format(name, duration * 1000, peak / 1024, len(result)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--xml', help='file with a recorded getdevicelistinfos response')
+    parser.add_argument('--devices', type=int, default=500, help='number of devices of the synthetic device list')
+    parser.add_argument('--configured', type=int, default=10, help='number of devices configured in items')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.xml:
+        with open(args.xml, encoding='utf-8') as f:
+            plain = f.read()
+    else:
+        plain = make_device_list(switches=args.devices // 2, thermostats=args.devices - args.devices // 2, seed=0)
+
+    all_ains = list(parse_incremental(plain, None, ()).keys())
+    ains = set(all_ains[:args.configured])
+    fields = {'name', 'present', 'switch_state', 'power', 'energy', 'target_temperature', 'actual_temperature'}
+    print('{} bytes, {} devices, {} configured'.format(len(plain), len(all_ains), len(ains)))
+
+    measure('pyfritzhome', lambda: parse_pyfritzhome(plain), args.repeat)
+    measure('incremental', lambda: parse_incremental(plain, ains, fields), args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  This file is part of SmartHomeNG.
+#
+#  SmartHomeNG is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SmartHomeNG is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SmartHomeNG. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+"""
+Load benchmark of the plugin against the simulated Fritz!Box of tools/aha_simulator.py
+
+Runs startup (login and discovery), poll_device and update_item of the plugin for several numbers of devices and
+reports the startup time, cycle time, HTTP requests per cycle, CPU time and peak memory of the plugin. The simulator runs in a separate process,
+so the CPU time only contains the work of the plugin.
+
+The benchmark needs SmartHomeNG, the plugin has to be installed in the plugins directory of SmartHomeNG:
+    cd /usr/local/smarthome
+    python3 plugins/avm_smarthome/tools/benchmark.py --sizes 10 100 1000 --latency 0.01
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import tracemalloc
+import urllib.request
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+PLUGIN_DIR = os.path.dirname(TOOLS_DIR)
+
+sys.path.insert(0, TOOLS_DIR)
+
+from devicelist import make_ain
+
+SWITCH_ITEMS = ['name', 'present', 'switch_state', 'power', 'energy', 'voltage', 'temperature', 'firmware_version']
+THERMOSTAT_ITEMS = ['name', 'present', 'actual_temperature', 'target_temperature', 'battery_level', 'window_open',
+                    'temperature', 'firmware_version']
+
+
+class BenchItem(object):
+    """
+    Minimal item offering the methods of a SmartHomeNG item used by the plugin
+    """
+
+    def __init__(self, path, conf, parent=None):
+        self._path = path
+        self.conf = conf
+        self._parent = parent
+        self._children = []
+        self._value = None
+        self.updates = 0
+        if parent is not None:
+            parent._children.append(self)
+
+    def __call__(self, value=None, caller=None, source=None, dest=None):
+        if value is None:
+            return self._value
+        self._value = value
+        self.updates += 1
+
+    def __str__(self):
+        return self._path
+
+    def id(self):
+        return self._path
+
+    def return_parent(self):
+        return self._parent
+
+    def return_children(self):
+        return self._children
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_simulator(port, switches, thermostats, args):
+    command = [sys.executable, os.path.join(TOOLS_DIR, 'aha_simulator.py'), '--port', str(port),
+               '--switches', str(switches), '--thermostats', str(thermostats), '--latency', str(args.latency),
+               '--error-rate', str(args.error_rate), '--seed', '0']
+    if args.vary:
+        command.append('--vary')
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            simulator_stats(port)
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('Simulator did not start')
+
+
+def simulator_stats(port):
+    with urllib.request.urlopen('http://127.0.0.1:{}/simulator_stats'.format(port), timeout=5) as rsp:
+        return json.loads(rsp.read().decode())
+
+
+def load_plugin_class():
+    import plugins
+    name = 'plugins.' + os.path.basename(PLUGIN_DIR)
+    spec = importlib.util.spec_from_file_location(name, os.path.join(PLUGIN_DIR, '__init__.py'),
+                                                  submodule_search_locations=[PLUGIN_DIR])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module.AVM_smarthome
+
+
+def create_plugin(cls, sh, parameters):
+    # initialize the plugin the way lib/plugin.py does
+    plugin = cls.__new__(cls)
+    plugin._init_complete = True
+    plugin._set_configname('avm_smarthome')
+    plugin._set_shortname('avm_smarthome')
+    plugin._set_instance_name('')
+    plugin._set_sh(sh)
+    plugin._parameters = parameters
+    plugin.__init__(sh)
+    return plugin
+
+
+def create_items(plugin, switches, thermostats):
+    """
+    Creates device items with read items and one command item per device and lets the plugin parse them
+
+    :return: list of (command item, value) to be used for update_item
+    """
+    commands = []
+    devices = [('switch', index, SWITCH_ITEMS, 'set_switch_state') for index in range(switches)]
+    devices += [('thermostat', index, THERMOSTAT_ITEMS, 'set_temperature') for index in range(thermostats)]
+    for kind, index, attributes, command in devices:
+        device = BenchItem('avm.{}{}'.format(kind, index), {'avm_ain': make_ain(kind, index)})
+        plugin.parse_item(device)
+        for attribute in attributes:
+            plugin.parse_item(BenchItem('{}.{}'.format(device, attribute), {'avm_smarthome_data': attribute}, device))
+        item = BenchItem('{}.{}'.format(device, command), {'avm_smarthome_data': command}, device)
+        plugin.parse_item(item)
+        commands.append((item, True if command == 'set_switch_state' else 21.5))
+    return commands
+
+
+def measure(function, repeat):
+    """
+    :return: (wall time, cpu time, peak memory in bytes) per call
+    """
+    tracemalloc.start()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    for _ in range(repeat):
+        function()
+    wall = (time.perf_counter() - wall) / repeat
+    cpu = (time.process_time() - cpu) / repeat
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return wall, cpu, peak
+
+
+def run_size(cls, sh, size, args):
+    switches = size // 2
+    thermostats = size - switches
+    port = free_port()
+    process = start_simulator(port, switches, thermostats, args)
+    try:
+        parameters = {'host': '127.0.0.1:{}'.format(port), 'username': 'smarthome', 'password': 'secret',
+                      'cycle': 300, 'static_cycle': 3600, 'min_cycle': 10, 'adaptive': False, 'refresh_interval': 0,
+                      'command_workers': args.workers, 'sid_cache': False, 'boxes': {}, 'breaker_threshold': 3,
+                      'breaker_backoff': 30, 'breaker_max_backoff': 900, 'timeout': 10, 'probe_timeout': 3,
+                      'history_snapshot': False, 'stats_cycle': 900, 'confirm_window': 15}
+        plugin = create_plugin(cls, sh, parameters)
+        commands = create_items(plugin, switches, thermostats)
+        startup = time.perf_counter()
+        plugin.startup()
+        startup = time.perf_counter() - startup
+        plugin._tick = plugin._get_tick()
+        plugin._commands.start()
+        plugin.alive = True
+
+        requests = []
+
+        def poll():
+            plugin.poll_device(force=True)
+            requests.append(plugin._cycle_requests)
+
+        poll_wall, poll_cpu, poll_peak = measure(poll, args.repeat)
+
+        def update():
+            for item, value in commands:
+                item(value)
+                plugin.update_item(item, caller='benchmark')
+
+        update_wall, update_cpu, update_peak = measure(update, 1)
+        drain = time.perf_counter()
+        plugin._commands.join(timeout=600)
+        drain = time.perf_counter() - drain
+
+        plugin.alive = False
+        plugin._commands.stop()
+        plugin.disconnect()
+        stats = simulator_stats(port)
+    finally:
+        process.terminate()
+        process.wait()
+
+    print('{:>6} devices | startup: {:>7.1f} ms | poll: {:>9.1f} ms cycle {:>8.1f} ms cpu {:>5.1f} req/cycle {:>9.1f} KiB peak | '
+          'update_item: {:>8.1f} ms for {} commands, sent after {:>8.1f} ms | simulator: {} requests, {} errors'.format(
+              size, startup * 1000, poll_wall * 1000, poll_cpu * 1000, sum(requests) / len(requests), poll_peak / 1024,
+              update_wall * 1000, len(commands), (update_wall + drain) * 1000, stats['requests'], stats['errors']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000], help='numbers of devices')
+    parser.add_argument('--repeat', type=int, default=5, help='number of poll cycles per size')
+    parser.add_argument('--latency', type=float, default=0.0, help='delay of each response of the simulator in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests failing with HTTP 500')
+    parser.add_argument('--vary', action='store_true', help='change values of the simulated devices with each query')
+    parser.add_argument('--workers', type=int, default=2, help='value of the plugin parameter command_workers')
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.getcwd())
+    from tests.mock.core import MockSmartHome
+    sh = MockSmartHome()
+    cls = load_plugin_class()
+
+    for size in args.sizes:
+        run_size(cls, sh, size, args)
+
+
+if __name__ == '__main__':
+    main()
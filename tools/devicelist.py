@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#########################################################################
+#  This file is part of SmartHomeNG.
+#
+#  SmartHomeNG is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SmartHomeNG is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SmartHomeNG. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+"""
+Generator for synthetic getdevicelistinfos responses of a Fritz!Box
+"""
+
+import random
+
+SWITCH_BITMASK = 35712          # FRITZ!DECT 200: switch, power meter, temperature sensor
+THERMOSTAT_BITMASK = 320        # Comet DECT / FRITZ!DECT 301: thermostat, temperature sensor
+ALARM_BITMASK = 8208            # HAN-FUN sensor with alert function
+
+SWITCH_TEMPLATE = (
+    '<device identifier="{ain}" id="{id}" functionbitmask="35712" fwversion="04.16" manufacturer="AVM" productname="FRITZ!DECT 200">'
+    '<present>{present}</present><txbusy>0</txbusy><name>Steckdose {id}</name>'
+    '<switch><state>{state}</state><mode>manuell</mode><lock>0</lock><devicelock>0</devicelock></switch>'
+    '<powermeter><voltage>{voltage}</voltage><power>{power}</power><energy>{energy}</energy></powermeter>'
+    '<temperature><celsius>{celsius}</celsius><offset>0</offset></temperature>'
+    '</device>'
+)
+
+THERMOSTAT_TEMPLATE = (
+    '<device identifier="{ain}" id="{id}" functionbitmask="320" fwversion="04.94" manufacturer="AVM" productname="FRITZ!DECT 301">'
+    '<present>{present}</present><txbusy>0</txbusy><name>Heizung {id}</name>'
+    '<battery>{battery}</battery><batterylow>0</batterylow>'
+    '<temperature><celsius>{celsius}</celsius><offset>-5</offset></temperature>'
+    '<hkr><tist>{tist}</tist><tsoll>{tsoll}</tsoll><absenk>32</absenk><komfort>42</komfort><lock>0</lock><devicelock>0</devicelock>'
+    '<errorcode>0</errorcode><windowopenactiv>0</windowopenactiv><windowopenactiveendtime>0</windowopenactiveendtime>'
+    '<boostactive>0</boostactive><boostactiveendtime>0</boostactiveendtime><batterylow>0</batterylow><battery>{battery}</battery>'
+    '<nextchange><endperiod>1577836800</endperiod><tchange>32</tchange></nextchange>'
+    '<summeractive>0</summeractive><holidayactive>0</holidayactive></hkr>'
+    '</device>'
+)
+
+ALARM_TEMPLATE = (
+    '<device identifier="{ain}" id="{id}" functionbitmask="8208" fwversion="0.0" manufacturer="0x0feb" productname="HAN-FUN">'
+    '<present>{present}</present><txbusy>0</txbusy><name>Sensor {id}</name>'
+    '<alert><state>{state}</state></alert>'
+    '</device>'
+)
+
+
+def make_ain(kind, index):
+    """
+    Returns the AIN of the generated device with the given kind ('switch', 'thermostat' or 'alarm') and index
+    """
+    prefix = {'switch': '08761', 'thermostat': '09995', 'alarm': '11934'}[kind]
+    return '{} {:07d}'.format(prefix, index)
+
+
+def make_devices(switches=10, thermostats=10, alarms=0, seed=None):
+    """
+    Creates the state of synthetic devices
+
+    :param switches: number of switches (FRITZ!DECT 200)
+    :param thermostats: number of thermostats (FRITZ!DECT 301)
+    :param alarms: number of alarm sensors
+    :param seed: seed for the random values
+    :return: list of dicts with the values of the devices, 'kind' is 'switch', 'thermostat' or 'alarm'
+    """
+    rnd = random.Random(seed)
+    devices = []
+    device_id = 16
+    for index in range(switches):
+        devices.append({'kind': 'switch', 'ain': make_ain('switch', index), 'id': device_id, 'present': 1,
+                        'state': rnd.randint(0, 1), 'voltage': rnd.randint(225000, 235000), 'power': rnd.randint(0, 200000),
+                        'energy': rnd.randint(0, 1000000), 'celsius': rnd.randint(180, 260)})
+        device_id += 1
+    for index in range(thermostats):
+        devices.append({'kind': 'thermostat', 'ain': make_ain('thermostat', index), 'id': device_id, 'present': 1,
+                        'battery': rnd.randint(0, 100), 'celsius': rnd.randint(180, 260),
+                        'tist': rnd.randint(36, 52), 'tsoll': rnd.randint(32, 44)})
+        device_id += 1
+    for index in range(alarms):
+        devices.append({'kind': 'alarm', 'ain': make_ain('alarm', index), 'id': device_id, 'present': 1,
+                        'state': rnd.randint(0, 1)})
+        device_id += 1
+    return devices
+
+
+TEMPLATES = {'switch': SWITCH_TEMPLATE, 'thermostat': THERMOSTAT_TEMPLATE, 'alarm': ALARM_TEMPLATE}
+
+
+def render_device_list(devices):
+    """
+    Creates the xml of a getdevicelistinfos response for the given devices
+
+    :param devices: list of dicts as returned by make_devices()
+    :return: xml as str
+    """
+    parts = ['<devicelist version="1" fwversion="7.21">']
+    for device in devices:
+        parts.append(TEMPLATES[device['kind']].format(**device))
+    parts.append('</devicelist>')
+    return ''.join(parts)
+
+
+def make_device_list(switches=10, thermostats=10, alarms=0, seed=None):
+    """
+    Creates the xml of a getdevicelistinfos response
+
+    :param switches: number of switches (FRITZ!DECT 200)
+    :param thermostats: number of thermostats (FRITZ!DECT 301)
+    :param alarms: number of alarm sensors
+    :param seed: seed for the random values
+    :return: xml as str
+    """
+    return render_device_list(make_devices(switches, thermostats, alarms, seed))